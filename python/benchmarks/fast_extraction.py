@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+This script compares the --fast extraction against the default layout analysis.
+For every pdf it prints the time taken by both modes and how much their word
+counts agree, after the same cleaning done by peacewordcloud.py.
+
+USAGE:
+	python benchmarks/fast_extraction.py [--word-gap=NUMBER] [--pages=RANGE] file.pdf [file.pdf ...]
+
+--word-gap changes FAST_WORD_GAP, to try other values of the heuristic.
+"""
+
+# Standard library imports
+from __future__ import print_function
+import os
+import sys
+import getopt
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# peacewordcloud imports
+import peacewordcloud
+
+def count_words(pdf_file, fast, first_page, last_page):
+	"""
+	This function extracts pdf_file and returns the Counter of its cleaned words and the seconds taken.
+	"""
+	normalizer = peacewordcloud.TextNormalizer()
+	counts = Counter()
+	start = time.time()
+	for text_box in peacewordcloud.extract_page_range(pdf_file, first_page, last_page, fast=fast):
+		counts.update(normalizer.normalize(text_box).split())
+	return counts, time.time() - start
+
+def agreement(layout_counts, fast_counts):
+	"""
+	This function returns the proportion of the words that both counts share, from 0 to 1.
+	"""
+	total = max(sum(layout_counts.values()), sum(fast_counts.values()))
+	if total == 0:
+		return 1.0
+	shared = sum((layout_counts & fast_counts).values())
+	return shared / float(total)
+
+def top_agreement(layout_counts, fast_counts, n=100):
+	"""
+	This function returns the proportion of the n most common layout words that are
+	also among the n most common fast words.
+	"""
+	layout_top = set(word for word, count in layout_counts.most_common(n))
+	fast_top = set(word for word, count in fast_counts.most_common(n))
+	if len(layout_top) == 0:
+		return 1.0
+	return len(layout_top & fast_top) / float(len(layout_top))
+
+if __name__ == "__main__":
+	opts, pdf_files = getopt.getopt(sys.argv[1:], "", ["word-gap=", "pages="])
+	first_page, last_page = 0, None
+	for option, value in opts:
+		if option == "--word-gap":
+			peacewordcloud.FAST_WORD_GAP = float(value)
+		elif option == "--pages":
+			first_page, last_page = peacewordcloud.parse_page_range(value)
+	if len(pdf_files) == 0:
+		print(__doc__)
+		sys.exit(2)
+
+	print("word gap:", peacewordcloud.FAST_WORD_GAP)
+	print("pdf\tlayout (s)\tfast (s)\tspeedup\tlayout words\tfast words\tagreement\ttop 100")
+	for pdf_file in pdf_files:
+		layout_counts, layout_seconds = count_words(pdf_file, False, first_page, last_page)
+		fast_counts, fast_seconds = count_words(pdf_file, True, first_page, last_page)
+		print("%s\t%.2f\t%.2f\t%.1fx\t%d\t%d\t%.3f\t%.2f" % (os.path.basename(pdf_file), layout_seconds, fast_seconds,
+			layout_seconds / max(fast_seconds, 1e-9), sum(layout_counts.values()), sum(fast_counts.values()),
+			agreement(layout_counts, fast_counts), top_agreement(layout_counts, fast_counts)))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""
+This script compares the throughput of TextNormalizer against the previous
+remove_punctuation and remove_no_alpha functions, which worked word by word.
+The text is the bundled R frecuency tables, repeated to get a measurable size.
+
+USAGE:
+	python benchmarks/normalizer.py [REPEAT]
+"""
+
+# Standard library imports
+from __future__ import print_function
+import os
+import sys
+import re
+import string
+import glob
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# peacewordcloud imports
+from peacewordcloud import TextNormalizer
+from frequency_index import detect_encoding
+
+ASSETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "assets")
+
+def remove_punctuation(text):
+	"""
+	This function is the previous remove_punctuation, which built its table on every call.
+	"""
+	punctuation = string.punctuation + '¡¿”“•\r\n´'
+	transtable = text.maketrans('', '', punctuation)
+	return text.translate(transtable)
+
+def remove_no_alpha(text):
+	"""
+	This function is the previous remove_no_alpha, with an uncompiled pattern.
+	"""
+	return [ re.sub(r"[^a-zA-ZñÑáéíóúÁÉÍÓÚ ]","", word) for word in text]
+
+def old_normalize(block):
+	block = remove_punctuation(block)
+	block = remove_no_alpha([block])[0]
+	return block.lower().split()
+
+def read_blocks():
+	"""
+	This function returns the lines of the bundled R frecuency tables as text blocks.
+	"""
+	blocks = []
+	for rfile in sorted(glob.glob(os.path.join(ASSETS, "rfiles", "*.txt"))):
+		fp = open(rfile, encoding=detect_encoding(rfile))
+		blocks.extend(line.replace("\t", " ") for line in fp)
+		fp.close()
+	return blocks
+
+def measure(function, blocks):
+	start = time.time()
+	words = [ function(block) for block in blocks ]
+	return words, time.time() - start
+
+if __name__ == "__main__":
+	repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+	blocks = read_blocks() * repeat
+	size = sum(len(block) for block in blocks) / 1e6
+
+	normalizer = TextNormalizer()
+	old_words, old_seconds = measure(old_normalize, blocks)
+	new_words, new_seconds = measure(lambda block: normalizer.normalize(block).split(), blocks)
+
+	print("blocks: %d (%.1f M characters)" % (len(blocks), size))
+	print("old: %.3f s (%.1f M characters/s)" % (old_seconds, size / old_seconds))
+	print("new: %.3f s (%.1f M characters/s)" % (new_seconds, size / new_seconds))
+	print("speedup: %.1fx" % (old_seconds / new_seconds))
+	if old_words != new_words:
+		print("The words differ!")
+		sys.exit(1)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""
+This script writes a single line dump like the ones of --save-file, loads it back
+with process_saved_file and fails if the load takes longer than the time budget.
+
+USAGE:
+	python benchmarks/saved_file.py [MEGABYTES] [SECONDS]
+
+Defaults to a 100 MB dump and a budget of 10 seconds.
+"""
+
+# Standard library imports
+from __future__ import print_function
+import os
+import sys
+import random
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# peacewordcloud imports
+from peacewordcloud import PeaceWordCloud
+
+def write_dump(dump_file, size):
+	"""
+	This function writes about size bytes of random spanish-like words in a single line.
+	"""
+	rand = random.Random(1)
+	letters = "abcdefghijklmnopqrstuvwxyzñáéíóú"
+	words = [ "".join(rand.choice(letters) for i in range(rand.randint(2, 12))) for j in range(50000) ]
+	chunk = " ".join(rand.choice(words) for i in range(100000)).encode("utf-8")
+	fp = open(dump_file, "wb")
+	written = 0
+	separator = b""
+	while written < size:
+		fp.write(separator + chunk)
+		written += len(separator) + len(chunk)
+		separator = b" "
+	fp.close()
+
+if __name__ == "__main__":
+	megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+	budget = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+
+	fd, dump_file = tempfile.mkstemp(suffix=".txt")
+	os.close(fd)
+	try:
+		write_dump(dump_file, megabytes * 1024 * 1024)
+		# process_saved_file does not need the lexicon, so the object is not initialized
+		pwc = PeaceWordCloud.__new__(PeaceWordCloud)
+		start = time.time()
+		words = 0
+		for block in pwc.process_saved_file(dump_file):
+			words += len(block.split())
+		seconds = time.time() - start
+	finally:
+		os.remove(dump_file)
+
+	print("loaded %d MB, %d words in %.2f s (budget %.2f s)" % (megabytes, words, seconds, budget))
+	if seconds > budget:
+		print("The load is over the time budget!")
+		sys.exit(1)
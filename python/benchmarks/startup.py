@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""
+This script measures the import time of the command line programs with
+python -X importtime, and fails if any of them goes over the time budget or
+imports a heavy dependency just to print its usage.
+
+USAGE:
+	python benchmarks/startup.py [MILLISECONDS] [RUNS]
+
+Defaults to a budget of 100 milliseconds, the best of 5 runs of every program.
+The imports done by the interpreter itself, like site, are not counted.
+"""
+
+# Standard library imports
+from __future__ import print_function
+import os
+import sys
+import subprocess
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Programs checked, with the arguments that print their usage
+PROGRAMS = [
+	["peacewordcloud.py", "--help"],
+	["peacewordcloud-r.py", "--help"],
+	["text2ldac.py", "--help"],
+]
+
+# Modules that must only be imported by the code paths that use them
+HEAVY_MODULES = ("pdfminer", "nltk", "PIL", "numpy", "wordcloud", "matplotlib")
+
+def import_times(arguments):
+	"""
+	This function runs python -X importtime with arguments and returns a list of
+	(depth, module, cumulative microseconds), one per imported module.
+	"""
+	process = subprocess.run([sys.executable, "-X", "importtime"] + arguments, cwd=PYTHON_DIR,
+		stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+	imports = []
+	for line in process.stderr.splitlines():
+		if not line.startswith("import time:"):
+			continue
+		fields = line[len("import time:"):].split("|")
+		if len(fields) != 3 or not fields[1].strip().isdigit():
+			continue
+		name = fields[2][1:]
+		depth = (len(name) - len(name.lstrip())) // 2
+		imports.append((depth, name.strip(), int(fields[1])))
+	return imports
+
+def startup_time(arguments, interpreter_modules):
+	"""
+	This function returns the milliseconds spent importing the top level modules of
+	a program that the interpreter does not import by itself, and the heavy modules imported.
+	"""
+	imports = import_times(arguments)
+	microseconds = sum(cumulative for depth, name, cumulative in imports
+		if depth == 0 and name not in interpreter_modules)
+	heavy = sorted(set(name.split(".")[0] for depth, name, cumulative in imports) & set(HEAVY_MODULES))
+	return microseconds / 1000.0, heavy
+
+if __name__ == "__main__":
+	budget = float(sys.argv[1]) if len(sys.argv) > 1 else 100.0
+	runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+	interpreter_modules = set(name for depth, name, cumulative in import_times(["-c", "pass"]))
+	failures = 0
+	for program in PROGRAMS:
+		results = [ startup_time(program, interpreter_modules) for run in range(runs) ]
+		milliseconds = min(result[0] for result in results)
+		heavy = results[0][1]
+		status = "ok"
+		if milliseconds > budget:
+			status = "over the budget"
+		if len(heavy) > 0:
+			status = "imports " + ", ".join(heavy)
+		if status != "ok":
+			failures += 1
+		print("%s: %.1f ms (budget %.1f ms) %s" % (" ".join(program), milliseconds, budget, status))
+
+	if failures > 0:
+		sys.exit(1)
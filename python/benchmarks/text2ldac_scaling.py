@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+Times text2ldac.generate_dat_and_vocab_files on synthetic corpora of growing
+size, against the previous implementation that re-indexed the vocabulary
+for every document, and checks that both, and the new one with 3 jobs, write
+byte-identical .dat, .vocab and .dmap files.
+
+USAGE:
+    python benchmarks/text2ldac_scaling.py [DOCUMENTS ...]
+
+Defaults to corpora of 250, 500, 1000 and 2000 documents.
+"""
+
+from __future__ import print_function
+import codecs
+import operator
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lexicon
+import text2ldac
+
+def reindex(word_id_dict, min_index):
+    """
+    previous re-indexing of the word ids after removing words
+    """
+    num_word_shifts = 0
+    for word in word_id_dict:
+        cur_index = word_id_dict[word]
+
+        if cur_index > min_index:
+            word_id_dict[word] = min_index + num_word_shifts
+            num_word_shifts += 1
+
+def old_generate_dat_lines_and_word_ids(fnames, config):
+    """
+    previous converter, with a reindex() over the vocabulary per document
+    """
+    dat_lines = []
+    word_id_dict = dict()
+    used_docs = []
+    stopwords = lexicon.as_lexicon(config['stopwords'])
+
+    for docname in fnames:
+        freq_dict = dict()
+        new_words = set()
+
+        try:
+            with codecs.open(docname, 'r', 'utf-8') as doc:
+                for line in doc:
+                    words = stopwords.remove_phrases(
+                            [text2ldac.clean_word(word) for word in line.split()])
+                    for word in words:
+                        if len(word) < config['minlength'] or word in stopwords:
+                            continue
+                        if not word in word_id_dict:
+                            freq_dict[word] = 1
+                            word_id_dict[word] = len(word_id_dict)
+                            new_words.add(word)
+                        else:
+                            freq = freq_dict.setdefault(word, 0)
+                            freq_dict[word] = freq + 1
+        except UnicodeDecodeError as u_error:
+            print('Document "{0}" has encoding errors and is ignored!\n{1}'.format(
+                docname, u_error))
+
+        if len(freq_dict)==0:
+            print('Document "{0}" (#{1}) seems to be empty and is ignored!'.format(
+                docname,fnames.index(docname)))
+            continue
+        else:
+            used_docs.append(docname)
+
+        remove_list = [word for word in freq_dict.keys() if\
+            freq_dict[word] < config['minoccurrence']]
+        remove_word_min_index = len(word_id_dict)
+
+        for word in remove_list:
+            freq_dict.pop(word)
+            if word in new_words:
+                word_index = word_id_dict[word]
+                if word_index < remove_word_min_index:
+                    remove_word_min_index = word_index
+                word_id_dict.pop(word)
+        reindex(word_id_dict, remove_word_min_index)
+
+        dat_line =  ''
+        for word in freq_dict.keys():
+            dat_line += str(word_id_dict[word]) + ':' + str(freq_dict[word]) + ' '
+        dat_lines.append(str(len(freq_dict)) + ' ' + dat_line[:-1] + '\n')
+
+    text2ldac.write_document_map_file(used_docs, config['dmapname'])
+
+    return dat_lines, word_id_dict
+
+def old_generate_dat_and_vocab_files(fnames, config):
+    with codecs.open(config['datname'], 'w', 'utf-8') as datfile:
+        dat_lines, word_id_dict = old_generate_dat_lines_and_word_ids(fnames,
+                config)
+        datfile.writelines(dat_lines)
+
+    with codecs.open(config['vocabname'], 'w', 'utf-8') as vocabfile:
+        for item in sorted(word_id_dict.items(), key=operator.itemgetter(1)):
+            vocabfile.write(item[0]+'\n')
+
+def write_corpus(directory, documents, rand):
+    """
+    write documents files of zipf-like words, with a few empty documents
+    """
+    vocabulary = ['w{0}'.format(i) for i in range(documents * 20)]
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    fnames = []
+    for doc_index in range(documents):
+        fname = os.path.join(directory, 'doc{0:06d}.txt'.format(doc_index))
+        with codecs.open(fname, 'w', 'utf-8') as doc:
+            if doc_index % 97 != 0:
+                words = rand.choices(vocabulary, weights, k=rand.randint(50, 400))
+                doc.write(' '.join(words) + '.\n')
+        fnames.append(fname)
+    return fnames
+
+def make_config(directory, prefix, minoccurrence, jobs=1):
+    return {'datname': os.path.join(directory, prefix + '.dat'),
+            'vocabname': os.path.join(directory, prefix + '.vocab'),
+            'dmapname': os.path.join(directory, prefix + '.dmap'),
+            'minlength': 1, 'minoccurrence': minoccurrence,
+            'stopwords': lexicon.Lexicon(), 'jobs': jobs}
+
+def read_outputs(config):
+    outputs = []
+    for name in ('datname', 'vocabname', 'dmapname'):
+        with open(config[name], 'rb') as f:
+            outputs.append(f.read())
+    return outputs
+
+def timed(function, *args):
+    start = time.time()
+    #the converters print a summary, which is not part of the benchmark
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        function(*args)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return time.time() - start
+
+if __name__ == '__main__':
+    sizes = [int(size) for size in sys.argv[1:]] or [250, 500, 1000, 2000]
+    rand = random.Random(1)
+    differences = 0
+
+    print('documents minoccurrence   old (s)   new (s)  speedup  -j 3 (s)')
+    for documents in sizes:
+        directory = tempfile.mkdtemp()
+        try:
+            fnames = write_corpus(directory, documents, rand)
+            for minoccurrence in (1, 2, 3):
+                old_config = make_config(directory, 'old', minoccurrence)
+                new_config = make_config(directory, 'new', minoccurrence)
+                jobs_config = make_config(directory, 'jobs', minoccurrence, 3)
+                old_seconds = timed(old_generate_dat_and_vocab_files, fnames, old_config)
+                new_seconds = timed(text2ldac.generate_dat_and_vocab_files, fnames, new_config)
+                jobs_seconds = timed(text2ldac.generate_dat_and_vocab_files, fnames, jobs_config)
+                expected = read_outputs(old_config)
+                identical = (read_outputs(new_config) == expected and
+                        read_outputs(jobs_config) == expected)
+                if not identical:
+                    differences += 1
+                print('{0:9d} {1:13d} {2:9.2f} {3:9.2f} {4:7.1f}x {5:9.2f}{6}'.format(
+                    documents, minoccurrence, old_seconds, new_seconds,
+                    old_seconds / max(new_seconds, 1e-9), jobs_seconds,
+                    '' if identical else '  OUTPUT DIFFERS'))
+        finally:
+            shutil.rmtree(directory)
+
+    if differences > 0:
+        sys.exit(1)
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+# Standard library imports
+from __future__ import print_function
+import sys
+import heapq
+import operator
+import multiprocessing
+
+# PIL, numpy and wordcloud are imported only by the functions that use them,
+# so the batch workers and --help start faster
+
+# frequency index imports
+from frequency_index import read_frecuency_table
+
+# Class of the reduced layout WordCloud, defined on first use
+_tail_step_word_cloud = None
+
+def tail_step_word_cloud(head_words, tail_font_step, **kwargs):
+	"""
+	This function returns a WordCloud that tries every font size for the head_words first
+	words it places, and every tail_font_step font sizes for the long tail of words.
+	kwargs are the arguments of WordCloud.
+	"""
+	global _tail_step_word_cloud
+	if _tail_step_word_cloud == None:
+		# wordcloud imports
+		from wordcloud import WordCloud
+
+		class TailStepWordCloud(WordCloud):
+			"""
+			WordCloud reads font_step every time a word does not fit, and calls color_func
+			once for every word it places, so color_func counts the placed words and
+			font_step grows once head_words have been placed.
+			"""
+
+			def __init__(self, head_words, tail_font_step, **kwargs):
+				self.head_words = head_words
+				self.tail_font_step = tail_font_step
+				self.placed = 0
+				self.generating = False
+				WordCloud.__init__(self, **kwargs)
+				self.word_color_func = self.color_func
+				self.color_func = self.count_placed
+
+			@property
+			def font_step(self):
+				return self.tail_font_step if self.placed >= self.head_words else self.head_font_step
+
+			@font_step.setter
+			def font_step(self, value):
+				self.head_font_step = value
+
+			def count_placed(self, *args, **kwargs):
+				self.placed += 1
+				return self.word_color_func(*args, **kwargs)
+
+			def generate_from_frequencies(self, frequencies, max_font_size=None):
+				if self.generating:
+					# WordCloud draws the first two words on their own to find the font size,
+					# they do not count as placed
+					placed = self.placed
+					try:
+						return WordCloud.generate_from_frequencies(self, frequencies, max_font_size)
+					finally:
+						self.placed = placed
+				self.placed = 0
+				self.generating = True
+				try:
+					return WordCloud.generate_from_frequencies(self, frequencies, max_font_size)
+				finally:
+					self.generating = False
+
+		_tail_step_word_cloud = TailStepWordCloud
+	return _tail_step_word_cloud(head_words, tail_font_step, **kwargs)
+
+class CloudRenderer():
+	"""
+	This class draws wordclouds over mask images.
+	Every mask is read and converted once, and its WordCloud, with the resolved
+	font, is kept to draw all the clouds that use the same mask.
+
+	WordCloud places the words with an integral image of the mask occupancy that is
+	updated as words are placed, so the placement cost grows with the mask area and
+	with the number of font sizes tried per word. With a layout_scale greater than 1
+	the words are placed over a mask reduced layout_scale times, and after the
+	head_words first words only every other font size is tried. The image is drawn
+	back at the size of the original mask.
+	"""
+
+	def __init__(self, max_words=2000, background_color="white", font_path=None, layout_scale=1, head_words=200):
+		self.max_words = max_words
+		self.background_color = background_color
+		self.font_path = font_path
+		self.layout_scale = max(1, int(layout_scale))
+		self.head_words = head_words
+		self.clouds = {}
+		self.sizes = {}
+
+	def read_mask(self, base_image):
+		"""
+		This function reads the mask image as an array, reduced by layout_scale.
+		The size of the original image is kept in sizes.
+		"""
+		# PIL and numpy imports
+		from PIL import Image
+		import numpy as np
+
+		image = Image.open(base_image)
+		self.sizes[base_image] = image.size
+		if self.layout_scale > 1:
+			width, height = image.size
+			size = (max(1, width // self.layout_scale), max(1, height // self.layout_scale))
+			image = image.resize(size, Image.NEAREST)
+		return np.array(image)
+
+	def cloud(self, base_image):
+		"""
+		This function returns the WordCloud of base_image, creating it the first time.
+		"""
+		if base_image not in self.clouds:
+			# wordcloud imports
+			from wordcloud import WordCloud
+
+			# Read the mask image
+			base_image_mask = self.read_mask(base_image)
+			if self.layout_scale > 1:
+				self.clouds[base_image] = tail_step_word_cloud(self.head_words, 2, font_path=self.font_path, background_color=self.background_color, max_words=self.max_words,
+					mask=base_image_mask, scale=self.layout_scale, min_font_size=max(1, 4 // self.layout_scale))
+			else:
+				self.clouds[base_image] = WordCloud(font_path=self.font_path, background_color=self.background_color, max_words=self.max_words, mask=base_image_mask)
+		return self.clouds[base_image]
+
+	def render(self, base_image, frecuencies, output_file, top_k=None):
+		"""
+		This function draws frecuencies over base_image and stores it in output_file.
+		frecuencies is anything accepted by top_frequencies. Only the top_k most frecuent
+		words, max_words by default, are passed to the wordcloud.
+		"""
+		wc = self.cloud(base_image)
+
+		# Generate word cloud
+		wc.generate_from_frequencies(top_frequencies(frecuencies, top_k if top_k != None else self.max_words))
+
+		# Store to file
+		if self.layout_scale == 1:
+			wc.to_file(output_file)
+		else:
+			self.full_size_image(wc.to_image(), self.sizes[base_image]).save(output_file, optimize=True)
+
+	def full_size_image(self, image, size):
+		"""
+		This function returns image with the given size.
+		The reduced mask is rounded down, so the image drawn from it can be up to
+		layout_scale - 1 pixels smaller than size. The missing border is filled with
+		the background, so the words are not resampled.
+		"""
+		if image.size == size:
+			return image
+
+		# PIL imports
+		from PIL import Image
+
+		full_image = Image.new(image.mode, size, self.background_color)
+		full_image.paste(image, (0, 0))
+		return full_image
+
+def is_array_pair(frecuencies):
+	"""
+	This function tells if frecuencies is a pair of numpy arrays (words, counts).
+	"""
+	return isinstance(frecuencies, tuple) and len(frecuencies) == 2 and hasattr(frecuencies[1], "dtype")
+
+def top_array_frequencies(words, counts, top_k=None):
+	"""
+	This function returns the top_k (word, count) pairs with the largest positive counts,
+	or all of them if top_k is None, from the arrays words and counts.
+	argpartition selects the top_k counts and only those are sorted. Ties keep their
+	order in the arrays, except at the top_k boundary, where any of them can be taken.
+	"""
+	# numpy imports
+	import numpy as np
+
+	counts = np.asarray(counts)
+	selected = np.flatnonzero(counts > 0)
+	if top_k != None and top_k < len(selected):
+		if top_k <= 0:
+			return []
+		selected = selected[np.argpartition(-counts[selected], top_k - 1)[:top_k]]
+	selected = selected[np.lexsort((selected, -counts[selected]))]
+	return list(zip(np.asarray(words)[selected].tolist(), counts[selected].tolist()))
+
+def top_frequencies(frecuencies, top_k=None):
+	"""
+	This function returns a dict with the top_k most frecuent words of frecuencies, or all
+	of them if top_k is None, and their counts divided by the largest one, as WordCloud does.
+	frecuencies can be a mapping of words to counts, like a FreqDist or a Counter, a pair
+	of numpy arrays (words, counts), or an iterable of (word, count) pairs.
+	Only the top_k words are kept and sorted, with a heap, or with argpartition for arrays,
+	so the rest of the words are never copied. Words without a positive count are dropped.
+	Ties keep the order of frecuencies.
+	"""
+	if is_array_pair(frecuencies):
+		top = top_array_frequencies(frecuencies[0], frecuencies[1], top_k)
+	else:
+		pairs = frecuencies.items() if hasattr(frecuencies, "keys") else frecuencies
+		pairs = (pair for pair in pairs if pair[1] > 0)
+		if top_k == None:
+			top = sorted(pairs, key=operator.itemgetter(1), reverse=True)
+		else:
+			top = heapq.nlargest(top_k, pairs, key=operator.itemgetter(1))
+	if len(top) == 0:
+		return {}
+
+	largest = float(top[0][1])
+	return dict((word, count / largest) for word, count in top)
+
+def read_manifest(manifest_file, default_base_image=None):
+	"""
+	This function reads a batch manifest and returns a list of (frecuency_file, output_file, base_image).
+	Each line has a frecuency file and an output file separated by tabs, and optionally
+	a base image. Lines without a base image use default_base_image.
+	Empty lines and lines beginning with # are ignored.
+	"""
+	tasks = []
+	fp = open(manifest_file, "r", encoding="utf-8")
+	for line_num, line in enumerate(fp):
+		line = line.strip()
+		if len(line) == 0 or line.startswith("#"):
+			continue
+		fields = line.split("\t")
+		base_image = fields[2] if len(fields) > 2 else default_base_image
+		if len(fields) < 2 or base_image == None:
+			fp.close()
+			raise ValueError("Invalid manifest line " + str(line_num + 1) + ": " + line)
+		tasks.append((fields[0], fields[1], base_image))
+	fp.close()
+	return tasks
+
+# Renderer of the current worker process
+_worker_renderer = None
+_worker_presorted = True
+
+def _init_worker(max_words, layout_scale, presorted=True):
+	global _worker_renderer, _worker_presorted
+	_worker_renderer = CloudRenderer(max_words, layout_scale=layout_scale)
+	_worker_presorted = presorted
+
+def _render_task(task):
+	"""
+	This function renders a manifest task with the renderer of the worker.
+	Returns the output file and None, or the error message if it fails.
+	"""
+	frecuency_file, output_file, base_image = task
+	try:
+		frecuencies = read_frecuency_table(frecuency_file, _worker_renderer.max_words, _worker_presorted)
+		_worker_renderer.render(base_image, frecuencies, output_file)
+	except Exception as err:
+		return output_file, str(err)
+	return output_file, None
+
+def render_batch(tasks, max_words, jobs=1, layout_scale=1, presorted=True):
+	"""
+	This function renders all the (frecuency_file, output_file, base_image) tasks.
+	With jobs greater than 1 the tasks are spread across a process pool, each worker
+	loading every mask only once. Only the first max_words lines of the frecuency
+	files are read when they are presorted, see read_frecuency_table.
+	Returns the number of failed tasks.
+	"""
+	failures = 0
+	if jobs > 1:
+		pool = multiprocessing.Pool(jobs, _init_worker, (max_words, layout_scale, presorted))
+		results = pool.imap_unordered(_render_task, tasks)
+	else:
+		pool = None
+		_init_worker(max_words, layout_scale, presorted)
+		results = (_render_task(task) for task in tasks)
+
+	try:
+		for output_file, error in results:
+			if error == None:
+				print("Created:", output_file)
+			else:
+				failures += 1
+				print("Failed:", output_file, error, file=sys.stderr)
+	finally:
+		if pool != None:
+			pool.close()
+			pool.join()
+	return failures
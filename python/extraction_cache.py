@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# Standard library imports
+import os
+import gzip
+import hashlib
+
+# Default maximum size of the cache, in bytes
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+def default_cache_dir():
+	"""
+	This function returns the directory used when no cache directory is specified.
+	It can be changed with the PEACEWORDCLOUD_CACHE environment variable.
+	"""
+	return os.environ.get("PEACEWORDCLOUD_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "peacewordcloud"))
+
+class ExtractionCache():
+	"""
+	This class stores the text boxes extracted from PDF files on disk.
+	Entries are keyed by the content hash of the PDF plus the extraction settings,
+	stored as gzipped text with one text box per line, and evicted in least recently
+	used order when the cache grows over max_bytes.
+	The compiled groups that GroupMatcher stores in the same directory count
+	towards max_bytes and are evicted in the same way.
+	"""
+
+	def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+		"""
+		This function creates the cache, and its directory if it does not exist.
+		"""
+		self.directory = directory if directory != None else default_cache_dir()
+		self.max_bytes = max_bytes
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory)
+
+	def key(self, pdf_file, settings):
+		"""
+		This function returns the cache key of a PDF file extracted with settings.
+		settings is a dict with the values that change the extracted text.
+		"""
+		digest = hashlib.sha256()
+		fp = open(pdf_file, "rb")
+		for chunk in iter(lambda: fp.read(1 << 20), b""):
+			digest.update(chunk)
+		fp.close()
+		digest.update(repr(sorted(settings.items())).encode("utf-8"))
+		return digest.hexdigest()
+
+	def path(self, key):
+		return os.path.join(self.directory, key + ".txt.gz")
+
+	def is_entry(self, name):
+		"""
+		This function tells if the file name is a cache entry or a compiled groups file.
+		The .pickle groups files of previous versions are kept only until they are evicted.
+		"""
+		return name.endswith(".txt.gz") or (name.startswith("groups-") and name.endswith((".json", ".pickle")))
+
+	def get(self, key):
+		"""
+		This function returns an iterator over the cached text boxes, or None if key is not cached.
+		"""
+		path = self.path(key)
+		try:
+			# Touching the entry marks it as recently used
+			os.utime(path, None)
+			# The entry is opened right away, so it can still be read if another process evicts it
+			entry = gzip.open(path, "rt", encoding="utf-8", newline="\n")
+		except FileNotFoundError:
+			# The entry is not cached, or another process sharing the directory has just evicted it
+			return None
+		return self.read_entry(entry)
+
+	def read_entry(self, entry):
+		"""
+		This generator yields the text boxes of an open cache entry and closes it.
+		"""
+		try:
+			for line in entry:
+				yield line[:-1] if line.endswith("\n") else line
+		finally:
+			entry.close()
+
+	def store(self, key, text_boxes):
+		"""
+		This generator yields text_boxes while it writes them to the cache.
+		The entry is only added once text_boxes has been fully consumed.
+		"""
+		path = self.path(key)
+		temporary_path = path + "." + str(os.getpid()) + ".tmp"
+		entry = gzip.open(temporary_path, "wt", encoding="utf-8", newline="\n")
+		completed = False
+		try:
+			for text_box in text_boxes:
+				entry.write(text_box.replace("\n", " ") + "\n")
+				yield text_box
+			completed = True
+		finally:
+			entry.close()
+			if completed:
+				os.replace(temporary_path, path)
+				self.evict()
+			else:
+				os.remove(temporary_path)
+
+	def evict(self):
+		"""
+		This function removes the least recently used entries until the cache fits in max_bytes.
+		Entries removed meanwhile by another process sharing the directory are skipped.
+		"""
+		entries = []
+		for name in os.listdir(self.directory):
+			if self.is_entry(name):
+				try:
+					stat = os.stat(os.path.join(self.directory, name))
+				except FileNotFoundError:
+					continue
+				entries.append((stat.st_mtime, stat.st_size, name))
+		entries.sort()
+
+		total = sum(entry[1] for entry in entries)
+		for mtime, size, name in entries:
+			if total <= self.max_bytes:
+				break
+			try:
+				os.remove(os.path.join(self.directory, name))
+			except FileNotFoundError:
+				pass
+			total -= size
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+# Standard library imports
+import gzip
+import codecs
+import heapq
+import itertools
+import operator
+from collections import Counter
+
+class FrequencyIndex():
+	"""
+	This class keeps the word counts of a document, or of a group of documents.
+	Indexes can be saved, loaded, merged and subtracted, so the frecuencies of a
+	department, or of a department minus one municipality, come from the stored
+	counts instead of reading every PDF again.
+	The file format is one "word<TAB>count" line per word, sorted by count, and it
+	is gzipped when the file name ends in ".gz".
+	"""
+
+	def __init__(self, counts=None):
+		"""
+		This function creates the index from a mapping of words to counts.
+		"""
+		self.counts = Counter()
+		if counts != None:
+			self.counts.update(counts)
+
+	@classmethod
+	def from_counter(cls, counts):
+		"""
+		This function creates the index over counts, a Counter like a FreqDist, without copying it.
+		The index updates counts in place when it is merged or subtracted.
+		"""
+		index = cls()
+		index.counts = counts
+		return index
+
+	@classmethod
+	def load(cls, index_file):
+		"""
+		This function reads an index from a file.
+		"""
+		fp = cls.open_file(index_file, "r")
+		counts = Counter()
+		for line in fp:
+			fields = line.rstrip("\r\n").split("\t")
+			if len(fields) == 2:
+				counts[fields[0]] += int(fields[1])
+		fp.close()
+		return cls(counts)
+
+	@classmethod
+	def load_all(cls, index_files):
+		"""
+		This function reads several indexes and returns their sum.
+		"""
+		index = cls()
+		for index_file in index_files:
+			index.merge(cls.load(index_file))
+		return index
+
+	@staticmethod
+	def open_file(index_file, mode):
+		if index_file.endswith(".gz"):
+			return gzip.open(index_file, mode + "t", encoding="utf-8")
+		return open(index_file, mode, encoding="utf-8")
+
+	def save(self, index_file):
+		"""
+		This function writes the index to a file.
+		"""
+		fp = self.open_file(index_file, "w")
+		fp.writelines(word + "\t" + str(count) + "\n" for word, count in self.most_common())
+		fp.close()
+
+	def merge(self, other):
+		"""
+		This function adds the counts of other to this index.
+		"""
+		self.counts.update(other.counts)
+		return self
+
+	def subtract(self, other):
+		"""
+		This function removes the counts of other from this index.
+		Words whose count drops to zero or less are removed.
+		"""
+		self.counts.subtract(other.counts)
+		for word in [ word for word, count in self.counts.items() if count <= 0 ]:
+			del self.counts[word]
+		return self
+
+	def __add__(self, other):
+		return FrequencyIndex(self.counts).merge(other)
+
+	def __sub__(self, other):
+		return FrequencyIndex(self.counts).subtract(other)
+
+	def __len__(self):
+		return len(self.counts)
+
+	def most_common(self, n=None):
+		"""
+		This function returns the n most common (word, count) pairs, or all of them if n is None.
+		"""
+		return self.counts.most_common(n)
+
+def detect_encoding(frecuency_file, sample_size=1 << 16):
+	"""
+	This function guesses the encoding of a text file from its first sample_size bytes.
+	A byte order mark wins, then UTF-8 if the sample decodes as UTF-8, then chardet if
+	it is installed, and cp1252, the encoding of the tables written by R on Windows, otherwise.
+	"""
+	fp = open(frecuency_file, "rb")
+	sample = fp.read(sample_size)
+	fp.close()
+
+	for bom, encoding in ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")):
+		if sample.startswith(bom):
+			return encoding
+
+	try:
+		sample.decode("utf-8")
+		return "utf-8"
+	except UnicodeDecodeError as err:
+		# The sample may end in the middle of a character
+		if len(sample) == sample_size and err.start >= len(sample) - 3:
+			return "utf-8"
+
+	try:
+		import chardet
+		encoding = chardet.detect(sample)["encoding"]
+		if encoding != None:
+			return encoding
+	except ImportError:
+		pass
+	return "cp1252"
+
+def iter_frecuency_table(fp):
+	"""
+	This function yields the (word, count) pairs of the "word<TAB>count" lines of fp.
+	Lines without a tab or without a numeric count, like a header, are skipped.
+	"""
+	for line in fp:
+		fields = line.rstrip("\r\n").split("\t")
+		if len(fields) >= 2:
+			try:
+				yield fields[0], int(fields[1])
+			except ValueError:
+				pass
+
+def read_frecuency_table(frecuency_file, max_words=None, presorted=True, encoding=None):
+	"""
+	This function reads a table with a "word<TAB>count" line per word, as the ones
+	generated with the R program, and returns a list of (word, count) pairs.
+	With max_words only the max_words most frequent pairs are returned. If the table is
+	presorted by decreasing count the reading stops after max_words lines. As soon as a
+	count greater than the previous one is found, or if presorted is False, the rest of
+	the table is read keeping only the max_words largest counts in a heap.
+	The encoding is detected with detect_encoding unless it is given.
+	"""
+	if encoding == None:
+		encoding = detect_encoding(frecuency_file)
+
+	fp = open(frecuency_file, encoding=encoding, errors="replace")
+	try:
+		rows = iter_frecuency_table(fp)
+		if max_words == None:
+			return list(rows)
+		if max_words <= 0:
+			return []
+
+		frecuencies = []
+		if presorted:
+			for word, count in rows:
+				if len(frecuencies) > 0 and count > frecuencies[-1][1]:
+					# The table is not sorted
+					rows = itertools.chain(frecuencies, [(word, count)], rows)
+					break
+				frecuencies.append((word, count))
+				if len(frecuencies) == max_words:
+					return frecuencies
+			else:
+				return frecuencies
+		return heapq.nlargest(max_words, rows, key=operator.itemgetter(1))
+	finally:
+		fp.close()
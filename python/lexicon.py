@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+# Standard library imports
+from __future__ import print_function
+import os
+import hashlib
+import json
+
+# Key that marks the end of a phrase inside a PhraseTrie
+# Words are never empty, and a string key can be stored as JSON
+LEAF = ""
+
+# Version of the compiled groups stored in the cache, part of their key
+GROUPS_CACHE_VERSION = 1
+
+# Stopwords already loaded from NLTK, by language
+_stopwords_cache = {}
+
+def load_stopwords(language="spanish"):
+	"""
+	This function loads the NLTK stopwords of a language as a frozenset.
+	The words are loaded only once per process.
+	"""
+	if language not in _stopwords_cache:
+		# NLTK imports
+		from nltk.corpus import stopwords
+		_stopwords_cache[language] = frozenset(stopwords.words(language))
+	return _stopwords_cache[language]
+
+def read_lines_as_lower(current_file):
+	"""
+	This function reads a file and returns a list of its non empty lines in lowercase.
+	"""
+	lines = []
+	if current_file != None:
+		fp = open(current_file, 'r', encoding="utf-8")
+		lines = [ line.strip().lower() for line in fp ]
+		fp.close()
+	return [ line for line in lines if len(line) > 0 ]
+
+class PhraseTrie():
+	"""
+	This class is a trie of word sequences.
+	Matches are greedy and return the longest phrase starting at a position.
+	"""
+
+	def __init__(self, phrases=()):
+		self.root = {}
+		for phrase in phrases:
+			self.add(phrase)
+
+	def add(self, phrase):
+		"""
+		This function adds a phrase, given as a sequence of words.
+		"""
+		node = self.root
+		for word in phrase:
+			node = node.setdefault(word, {})
+		node[LEAF] = True
+
+	@classmethod
+	def from_root(cls, root):
+		"""
+		This function creates a PhraseTrie from the root of another one, like one read from JSON.
+		Raises ValueError if root is not a valid trie.
+		"""
+		nodes = [root]
+		while len(nodes) > 0:
+			node = nodes.pop()
+			if not isinstance(node, dict):
+				raise ValueError("Invalid trie node")
+			for word, child in node.items():
+				if word == LEAF:
+					if child is not True:
+						raise ValueError("Invalid trie leaf")
+				else:
+					nodes.append(child)
+		trie = cls()
+		trie.root = root
+		return trie
+
+	def __len__(self):
+		return len(self.root)
+
+	def match(self, words, start):
+		"""
+		This function returns the end position of the longest phrase found at words[start],
+		or -1 if no phrase starts there.
+		"""
+		node = self.root
+		last_match = -1
+		position = start
+		while position < len(words) and words[position] in node:
+			node = node[words[position]]
+			position += 1
+			if LEAF in node:
+				last_match = position
+		return last_match
+
+class GroupMatcher():
+	"""
+	This class joins the groups of words found in a text as single tokens, like the
+	MWETokenizer of NLTK: at every position the longest group is taken and its words
+	are joined with separator, scanning from left to right.
+	The groups are compiled once into a PhraseTrie, so the cost of a text grows with
+	its length and the length of the groups, not with the number of groups.
+	"""
+
+	def __init__(self, groups=(), separator="_"):
+		"""
+		This function creates the GroupMatcher from group lines, one group per line.
+		"""
+		self.separator = separator
+		self.groups = PhraseTrie(words for words in (group.split() for group in groups) if len(words) > 0)
+
+	@classmethod
+	def load(cls, groups_file, cache_dir=None, separator="_"):
+		"""
+		This function creates a GroupMatcher with the groups read from groups_file.
+		If cache_dir is given, the compiled trie is stored there as JSON, keyed by the
+		content of the file and GROUPS_CACHE_VERSION, and read from there the next time.
+		A cached trie that can not be read is compiled again. cache_dir is the
+		directory of an ExtractionCache, which evicts the cached tries with its entries.
+		"""
+		if groups_file == None:
+			return cls(separator=separator)
+		if cache_dir == None:
+			return cls(read_lines_as_lower(groups_file), separator)
+
+		digest = hashlib.sha256(("groups-v" + str(GROUPS_CACHE_VERSION) + "\0" + separator).encode("utf-8"))
+		fp = open(groups_file, "rb")
+		digest.update(fp.read())
+		fp.close()
+		cache_file = os.path.join(cache_dir, "groups-" + digest.hexdigest() + ".json")
+		if os.path.exists(cache_file):
+			try:
+				# Touching the file marks it as recently used
+				os.utime(cache_file, None)
+				fp = open(cache_file, "r", encoding="utf-8")
+				try:
+					matcher = cls(separator=separator)
+					matcher.groups = PhraseTrie.from_root(json.load(fp))
+					return matcher
+				finally:
+					fp.close()
+			except (OSError, ValueError, RecursionError):
+				pass
+
+		matcher = cls(read_lines_as_lower(groups_file), separator)
+		# The trie is written to a temporary file first, so it is never read half written
+		tmp_file = cache_file + "." + str(os.getpid()) + ".tmp"
+		fp = open(tmp_file, "w", encoding="utf-8")
+		json.dump(matcher.groups.root, fp, ensure_ascii=False, separators=(",", ":"))
+		fp.close()
+		os.replace(tmp_file, cache_file)
+		return matcher
+
+	def __len__(self):
+		return len(self.groups)
+
+	def tokenize(self, words):
+		"""
+		This function returns words with every group joined as a single token.
+		"""
+		if len(self.groups) == 0:
+			return words
+		tokens = []
+		position = 0
+		while position < len(words):
+			end = self.groups.match(words, position)
+			if end > -1:
+				tokens.append(self.separator.join(words[position:end]))
+				position = end
+			else:
+				tokens.append(words[position])
+				position += 1
+		return tokens
+
+	def iter_tokens(self, blocks):
+		"""
+		This generator tokenizes one list of words at a time.
+		Groups are not joined across blocks.
+		"""
+		for words in blocks:
+			yield self.tokenize(words)
+
+class Lexicon():
+	"""
+	This class holds the stopwords and the filters used to drop words from a text.
+	Everything is loaded once into frozensets, so membership tests are O(1) and the
+	same object can be shared by several pipelines.
+	Filter lines with more than one word are removed as whole phrases.
+	"""
+
+	def __init__(self, stopwords=(), filters=()):
+		"""
+		This function creates the Lexicon from stopwords and filter lines.
+		"""
+		single_words = []
+		phrases = []
+		for line in filters:
+			words = line.split()
+			if len(words) == 1:
+				single_words.append(words[0])
+			elif len(words) > 1:
+				phrases.append(words)
+
+		self.stopwords = frozenset(stopwords)
+		self.filters = frozenset(single_words)
+		self.phrases = PhraseTrie(phrases)
+		self.words = self.stopwords | self.filters
+
+	@classmethod
+	def load(cls, filter_files=(), language="spanish"):
+		"""
+		This function creates a Lexicon with the NLTK stopwords of language and the
+		filters read from every file of filter_files.
+		If language is None, no stopwords are used.
+		"""
+		stopwords = load_stopwords(language) if language != None else ()
+		filters = []
+		for filter_file in filter_files:
+			filters.extend(read_lines_as_lower(filter_file))
+		return cls(stopwords, filters)
+
+	def __contains__(self, word):
+		return word in self.words
+
+	def remove_phrases(self, words):
+		"""
+		This function returns words without the multi-word filters.
+		"""
+		if len(self.phrases) == 0:
+			return words
+		result = []
+		position = 0
+		while position < len(words):
+			end = self.phrases.match(words, position)
+			if end > -1:
+				position = end
+			else:
+				result.append(words[position])
+				position += 1
+		return result
+
+	def remove_filters(self, words):
+		"""
+		This function returns words without the filters.
+		"""
+		return [ word for word in self.remove_phrases(words) if word not in self.filters ]
+
+	def remove_stopwords(self, words):
+		"""
+		This function returns words without the stopwords.
+		"""
+		return [ word for word in words if word not in self.stopwords ]
+
+	def filter_words(self, words):
+		"""
+		This function returns words without the filters nor the stopwords.
+		"""
+		return [ word for word in self.remove_phrases(words) if word not in self.words ]
+
+def as_lexicon(words):
+	"""
+	This function returns words as a Lexicon.
+	Any other iterable is taken as a list of filter lines.
+	"""
+	if isinstance(words, Lexicon):
+		return words
+	return Lexicon(filters=words)
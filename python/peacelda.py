@@ -5,6 +5,10 @@ from __future__ import print_function
 import os
 import sys
 import getopt
+import time
+import itertools
+import multiprocessing
+import csv
 
 # numpy imports
 import numpy as np
@@ -13,9 +17,108 @@ import numpy as np
 import text2ldac
 import lda
 
-# NLTK stopwords
-from nltk.corpus import stopwords
+# lexicon imports
+import lexicon
 
+# Document-term matrix of the current training worker process
+_worker_matrix = None
+
+def _init_training_worker(X):
+    global _worker_matrix
+    _worker_matrix = X
+
+def _train_model_worker(params):
+    return train_model(_worker_matrix, params)
+
+class EarlyStoppingLDA(lda.LDA):
+    """
+    This class is an LDA model that stops sampling when the log-likelihood converges.
+    The log-likelihood is checked every refresh iterations, and the sampling stops once
+    its relative improvement is below tol. n_iter_ keeps the number of iterations done.
+    It replaces lda.LDA._fit with the same sampling loop plus the convergence check.
+    """
+
+    def __init__(self, n_topics, n_iter=2000, alpha=0.1, eta=0.01, random_state=None, refresh=10, tol=1e-4):
+        lda.LDA.__init__(self, n_topics, n_iter=n_iter, alpha=alpha, eta=eta, random_state=random_state, refresh=refresh)
+        self.tol = tol
+
+    def _fit(self, X):
+        random_state = lda.utils.check_random_state(self.random_state)
+        rands = self._rands.copy()
+        self._initialize(X)
+        self.n_iter_ = self.n_iter
+        for it in range(self.n_iter):
+            random_state.shuffle(rands)
+            if it % self.refresh == 0:
+                ll = self.loglikelihood()
+                if len(self.loglikelihoods_) > 0 and self.converged(self.loglikelihoods_[-1], ll):
+                    self.loglikelihoods_.append(ll)
+                    self.n_iter_ = it
+                    break
+                self.loglikelihoods_.append(ll)
+            self._sample_topics(rands)
+
+        self.components_ = (self.nzw_ + self.eta).astype(float)
+        self.components_ /= np.sum(self.components_, axis=1)[:, np.newaxis]
+        self.topic_word_ = self.components_
+        self.doc_topic_ = (self.ndz_ + self.alpha).astype(float)
+        self.doc_topic_ /= np.sum(self.doc_topic_, axis=1)[:, np.newaxis]
+
+        # the sampling state is not needed after fitting
+        del self.WS
+        del self.DS
+        del self.ZS
+        return self
+
+    def converged(self, previous, current):
+        """
+        This function tells if the relative improvement from previous to current is below tol.
+        """
+        return (current - previous) <= self.tol * abs(previous)
+
+def train_model(X, params):
+    """
+    This function fits an LDA model with params, a dict with n_topics, n_iter, alpha, eta, seed,
+    and tol and check_every for early stopping. A tol of 0 runs all the iterations.
+    Returns the params, the model, its log-likelihood and the wall time in seconds.
+    """
+    start = time.time()
+    if params['tol'] > 0:
+        model = EarlyStoppingLDA(n_topics=params['n_topics'], n_iter=params['n_iter'], random_state=params['seed'],
+                                 alpha=params['alpha'], eta=params['eta'], refresh=params['check_every'], tol=params['tol'])
+    else:
+        model = lda.LDA(n_topics=params['n_topics'], n_iter=params['n_iter'], random_state=params['seed'],
+                        alpha=params['alpha'], eta=params['eta'])
+    model.fit(X)
+    return params, model, model.loglikelihood(), time.time() - start
+
+def save_model(model, vocab, model_file):
+    """
+    This function saves the topic-word matrix of a fitted model, its priors and its vocabulary
+    in a compressed numpy file.
+    The file is written through an open file, so numpy does not add .npz to its name.
+    """
+    with open(model_file, "wb") as f:
+        np.savez_compressed(f, components=model.components_, vocab=np.array(vocab),
+                            n_topics=model.n_topics, alpha=model.alpha, eta=model.eta)
+
+def load_model(model_file):
+    """
+    This function loads a model saved with save_model.
+    Returns the model, ready to transform new documents, and its vocabulary.
+    """
+    with np.load(model_file) as data:
+        model = lda.LDA(n_topics=int(data['n_topics']), alpha=float(data['alpha']), eta=float(data['eta']))
+        model.components_ = data['components']
+        model.topic_word_ = model.components_
+        vocab = tuple(data['vocab'].tolist())
+    return model, vocab
+
+def parse_numbers(value, number_type):
+    """
+    This function parses a comma separated list of numbers, like "10,20,30".
+    """
+    return [ number_type(number) for number in value.split(",") if len(number.strip()) > 0 ]
 
 def usage():
     print("""
@@ -31,6 +134,62 @@ OPTIONS:
 \t\tSpecifies a file with filters If no file is specified, no filters are used.
 \t\tThe filters file defines a filter per line.
 
+\t-m, --in-memory
+\t\tBuilds the document-term matrix in memory instead of writing and reading back
+\t\tthe data.ldac, data.vocab and data.dmap files.
+
+\t-j, --jobs=NUMBER
+\t\tSpecifies the number of processes used to tokenize the files and to train the models. Defaults to 1.
+
+\t-t, --topics=NUMBERS
+\t\tSpecifies the number of topics, or a comma separated list like 10,20,30. Defaults to 10.
+
+\t-n, --iterations=NUMBER
+\t\tSpecifies the number of Gibbs sampling iterations. Defaults to 1500.
+
+\t-a, --alpha=NUMBER
+\t\tSpecifies the document-topic prior. Defaults to 0.8.
+
+\t-e, --eta=NUMBER
+\t\tSpecifies the topic-word prior. Defaults to 0.2.
+
+\t-s, --seeds=NUMBERS
+\t\tSpecifies the random seed, or a comma separated list of seeds. Defaults to 1.
+\t\tA model is trained for every topics and seed combination. For every number of topics the
+\t\tseed with the best log-likelihood is reported. The log-likelihood and time of every model are written too.
+\t\tWith several numbers of topics, lda_result.txt has a section per number of topics, and the
+\t\tdocument-topic tables and the saved models get a suffix like _20topics, so you can choose one.
+
+\t--tolerance=NUMBER
+\t\tStops the sampling once the relative improvement of the log-likelihood is below NUMBER,
+\t\tfor example 0.0001. The iterations actually done are written to lda_result.txt.
+\t\tDefaults to 0, which runs all the iterations.
+
+\t--check-every=NUMBER
+\t\tSpecifies every how many iterations the log-likelihood is checked when --tolerance is used. Defaults to 50.
+
+\t--min-count=NUMBER
+\t\tIgnores the words that appear less than NUMBER times in all the files. Defaults to 1.
+
+\t--min-df=NUMBER
+\t\tIgnores the words that appear in less than NUMBER files. Defaults to 1.
+
+\t--max-df=NUMBER
+\t\tIgnores the words that appear in more than NUMBER files, or in more than that proportion
+\t\tof the files if NUMBER has a decimal point, for example 0.9. By default there is no limit.
+
+\t--max-vocab=NUMBER
+\t\tKeeps only the NUMBER most frequent words. By default there is no limit.
+\t\tThe vocabulary size before and after pruning is written to lda_result.txt.
+
+\t--save-model=FILE
+\t\tSaves the selected model and its vocabulary in FILE, a compressed numpy file (.npz).
+\t\tWith several numbers of topics, every selected model is saved, like FILE_20topics.npz.
+
+\t--infer=FILE
+\t\tLoads a model saved with --save-model and assigns topic distributions to the files of
+\t\tthe directory without training. The result is written to lda_inference.txt.
+
 \t-h, --help
 \t\tPrints the usage and exits.
 	""")
@@ -41,13 +200,32 @@ class PeaceLDA():
     This class processes a list of files and generates the LDA
     """
 
-    def __init__(self, directory, filters_file, verbose):
+    def __init__(self, directory, filters_file, verbose, in_memory=False, jobs=1,
+                 topics=(10,), n_iter=1500, alpha=0.8, eta=0.2, seeds=(1,), tol=0, check_every=50,
+                 model_out=None, model_in=None, min_count=1, min_df=1, max_df=None, max_vocab=None):
         """
         This function creates the PeaceLDA Object
+        A model is trained for every combination of topics and seeds.
+        The vocabulary is pruned with min_count, min_df, max_df and max_vocab before training.
         """
+        self.min_count = min_count
+        self.min_df = min_df
+        self.max_df = max_df
+        self.max_vocab = max_vocab
+        self.topics = topics
+        self.n_iter = n_iter
+        self.alpha = alpha
+        self.eta = eta
+        self.seeds = seeds
+        self.tol = tol
+        self.check_every = check_every
+        self.model_out = model_out
+        self.model_in = model_in
         self.verbose = verbose
+        self.in_memory = in_memory
+        self.jobs = jobs
         self.directory = directory
-        self.filters = self.read_file_as_lower(filters_file)
+        self.lexicon = lexicon.Lexicon.load([filters_file])
 
     def run(self):
         """
@@ -63,31 +241,156 @@ class PeaceLDA():
         config['dmapname'] = 'data.dmap'
         config['minlength'] = 1
         config['minoccurrence'] = 1
-        config['stopwords'] = stopwords.words('spanish') + self.filters
+        config['stopwords'] = self.lexicon
+        config['jobs'] = self.jobs
+        config['mincount'] = self.min_count
+        config['mindf'] = self.min_df
+        config['maxdf'] = self.max_df
+        config['maxvocab'] = self.max_vocab
         filenames = os.listdir(self.directory)
         files = [ self.directory + os.sep + elem for elem in filenames ]
-        text2ldac.generate_dat_and_vocab_files(files, config)
-
-        # analyse with lda
-        X = self.load_ldac(config["datname"])
-        vocab = self.load_vocab(config["vocabname"])
-        model = lda.LDA(n_topics=10, n_iter=1500, random_state=1, alpha=0.8, eta=0.2)
-        model.fit(X)
-        topic_word = model.topic_word_
+        if self.model_in != None:
+            return self.infer(files, config)
+
+        try:
+            if self.in_memory:
+                X, vocab, used_files = text2ldac.generate_document_term_matrix(files, config)
+            else:
+                text2ldac.generate_dat_and_vocab_files(files, config)
+                X = self.load_ldac(config["datname"])
+                vocab = self.load_vocab(config["vocabname"])
+                used_files = self.load_dmap(config["dmapname"])
+        except ValueError as err:
+            # the pruning left no words
+            print(str(err))
+            return 1
+
+        if X.shape[0] == 0 or X.shape[1] == 0:
+            print("Couldn't read words from the files!")
+            return 1
+
+        # analyse with lda, keeping the seed with the best log-likelihood of every number of topics
+        runs = self.train_models(X)
+        selected = self.select_models(runs)
         n_top_words = 8
         f = open("lda_result.txt", "w", encoding="utf-8")
-        for i, topic_dist in enumerate(topic_word):
-            topic_words = np.array(vocab)[np.argsort(topic_dist)][:-(n_top_words + 1):-1]
-            res = ' '.join(topic_words)
-            f.write('Topic' + str(i) + ':' + str(res) + "\n")
-
-        doc_topic = model.doc_topic_
-        for i in range(len(files)):
-            f.write(str(filenames[i]) + " (topic %: " +str(doc_topic[i]) + ")\n")
-            f.write(" (top topic: " + str(doc_topic[i].argmax()) + ")\n")
+        if 'pruned_vocabulary' in config:
+            f.write("Vocabulary: %d of %d words\n" % (config['pruned_vocabulary'][1], config['pruned_vocabulary'][0]))
+        for run_params, run_model, run_loglikelihood, run_seconds in runs:
+            f.write(self.describe_run(run_params, run_model, run_loglikelihood, run_seconds) + "\n")
+        for params, model, loglikelihood, seconds in selected:
+            # with several numbers of topics, the files of each one get a suffix
+            suffix = "" if len(selected) == 1 else "_%dtopics" % params['n_topics']
+            f.write("Selected: " + self.describe_run(params, model, loglikelihood, seconds) + "\n")
+            top_words = self.top_words(model.topic_word_, vocab, n_top_words)
+            f.writelines('Topic' + str(i) + ':' + ' '.join(words) + "\n" for i, words in enumerate(top_words))
+
+            self.write_document_topics(f, used_files, model.doc_topic_)
+            self.export_document_topics("lda_doc_topic" + suffix, used_files, model.doc_topic_)
+
+            if self.model_out != None:
+                root, extension = os.path.splitext(self.model_out)
+                model_file = root + suffix + extension
+                save_model(model, vocab, model_file)
+                print("Model saved in", model_file)
         f.close()
         return 0
 
+    def select_models(self, runs):
+        """
+        This function returns the run with the best log-likelihood of every number of topics,
+        in the order they were trained.
+        The log-likelihoods of different numbers of topics are not comparable, so every
+        number of topics keeps its own model.
+        """
+        best = dict()
+        for run in runs:
+            n_topics = run[0]['n_topics']
+            if n_topics not in best or run[2] > best[n_topics][2]:
+                best[n_topics] = run
+        return list(best.values())
+
+    def infer(self, files, config):
+        """
+        This function assigns topic distributions to files with a stored model, without training.
+        Words that are not in the vocabulary of the model are ignored.
+        """
+        model, vocab = load_model(self.model_in)
+        X, vocab, used_files = text2ldac.generate_document_term_matrix(files, config, vocab)
+        if X.shape[0] == 0:
+            print("Couldn't read words from the files!")
+            return 1
+
+        doc_topic = model.transform(X)
+        # documents without any word of the vocabulary get an uniform distribution
+        empty = np.asarray(X.sum(axis=1)).ravel() == 0
+        doc_topic[empty] = 1.0 / model.n_topics
+
+        f = open("lda_inference.txt", "w", encoding="utf-8")
+        self.write_document_topics(f, used_files, doc_topic)
+        f.close()
+        self.export_document_topics("lda_inference_doc_topic", used_files, doc_topic)
+        return 0
+
+    def top_words(self, topic_word, vocab, n_top_words):
+        """
+        This function returns the n_top_words most probable words of every topic, most probable first.
+        A single argpartition selects them for all the topics; only the selected words are sorted.
+        """
+        n_top_words = min(n_top_words, topic_word.shape[1])
+        top = np.argpartition(-topic_word, n_top_words - 1, axis=1)[:, :n_top_words]
+        order = np.argsort(-np.take_along_axis(topic_word, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return np.asarray(vocab)[top].tolist()
+
+    def write_document_topics(self, f, used_files, doc_topic):
+        top_topics = doc_topic.argmax(axis=1)
+        f.writelines(os.path.basename(used_files[i]) + " (topic %: " + str(doc_topic[i]) + ")\n" +
+                     " (top topic: " + str(top_topics[i]) + ")\n" for i in range(len(used_files)))
+
+    def export_document_topics(self, basename, used_files, doc_topic):
+        """
+        This function writes the document-topic table as basename.npy and as basename.csv,
+        with a row per document: its name, the probability of every topic and its top topic.
+        """
+        np.save(basename + ".npy", doc_topic)
+        top_topics = doc_topic.argmax(axis=1)
+        f = open(basename + ".csv", "w", encoding="utf-8", newline="")
+        writer = csv.writer(f)
+        writer.writerow(["document"] + [ "topic" + str(i) for i in range(doc_topic.shape[1]) ] + ["top_topic"])
+        writer.writerows([os.path.basename(used_files[i])] + row + [top_topics[i]] for i, row in enumerate(doc_topic.tolist()))
+        f.close()
+
+    def train_models(self, X):
+        """
+        This function trains a model for every combination of topics and seeds.
+        With jobs greater than 1 the models are trained in parallel processes.
+        Returns a list of (params, model, loglikelihood, seconds).
+        """
+        all_params = [ {'n_topics': n_topics, 'n_iter': self.n_iter, 'alpha': self.alpha, 'eta': self.eta, 'seed': seed,
+                        'tol': self.tol, 'check_every': self.check_every}
+                       for n_topics, seed in itertools.product(self.topics, self.seeds) ]
+
+        jobs = min(self.jobs, len(all_params))
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs, _init_training_worker, (X,))
+            try:
+                runs = pool.map(_train_model_worker, all_params)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            runs = [ train_model(X, params) for params in all_params ]
+
+        for params, model, loglikelihood, seconds in runs:
+            print(self.describe_run(params, model, loglikelihood, seconds))
+        return runs
+
+    def describe_run(self, params, model, loglikelihood, seconds):
+        iterations = getattr(model, 'n_iter_', params['n_iter'])
+        return "topics: %d seed: %d iterations: %d of %d alpha: %g eta: %g log-likelihood: %.0f time: %.1fs" % (
+            params['n_topics'], params['seed'], iterations, params['n_iter'], params['alpha'], params['eta'], loglikelihood, seconds)
+
     def load_ldac(self, filename):
         return lda.utils.ldac2dtm(open(filename, encoding="utf-8"), offset=0)
 
@@ -96,22 +399,10 @@ class PeaceLDA():
             vocab = tuple(f.read().split())
         return vocab
 
-    def read_file_as_lower(self, current_file):
-        """
-        This function reads a file and returns a list of lines in lowercase.
-        """
-        def lowers_removes_linesep(some_string):
-            if some_string.endswith("\n"):
-                some_string = some_string[:-1]
-            return some_string.lower()
-
-        lines = []
-        if current_file != None:
-            fp = open (current_file,'r', encoding="utf-8")
-            lines = fp.readlines()
-            fp.close()
-            lines = [ lowers_removes_linesep(line) for line in lines ]
-        return lines
+    def load_dmap(self, filename):
+        with open(filename, encoding="utf-8") as f:
+            dmap = [ line.rstrip("\n") for line in f ]
+        return dmap
 
     def printv(self, *text):
         """
@@ -123,8 +414,10 @@ class PeaceLDA():
 if __name__ == "__main__":
     # Process all the program arguments
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "vhd:f:",
-                                   ["verbose", "help", "directory=", "filters="])
+        opts, args = getopt.getopt(sys.argv[1:], "vhd:f:mj:t:n:a:e:s:",
+                                   ["verbose", "help", "directory=", "filters=", "in-memory", "jobs=",
+                                    "topics=", "iterations=", "alpha=", "eta=", "seeds=", "tolerance=", "check-every=",
+                                    "save-model=", "infer=", "min-count=", "min-df=", "max-df=", "max-vocab="])
     except getopt.GetoptError as err:
         # print help information and exit:
         print(str(err))  # will print something like "option -a not recognized"
@@ -135,6 +428,21 @@ if __name__ == "__main__":
     verbose = False
     directory = None
     filter_file = None
+    in_memory = False
+    jobs = 1
+    topics = [10]
+    n_iter = 1500
+    alpha = 0.8
+    eta = 0.2
+    seeds = [1]
+    tol = 0
+    check_every = 50
+    model_out = None
+    model_in = None
+    min_count = 1
+    min_df = 1
+    max_df = None
+    max_vocab = None
     for option, value in opts:
         if option in ("-h", "--help"):
             usage()
@@ -143,6 +451,72 @@ if __name__ == "__main__":
             directory = value
         elif option in ("-f", "--filters"):
             filter_file = value
+        elif option in ("-m", "--in-memory"):
+            in_memory = True
+        elif option in ("-j", "--jobs"):
+            try:
+                jobs = max(1, int(value))
+            except ValueError:
+                print("-j or --jobs must be a number. Taking 1 as default.")
+        elif option in ("-t", "--topics"):
+            try:
+                topics = parse_numbers(value, int)
+            except ValueError:
+                print("-t or --topics must be a list of numbers. Taking 10 as default.")
+        elif option in ("-n", "--iterations"):
+            try:
+                n_iter = int(value)
+            except ValueError:
+                print("-n or --iterations must be a number. Taking 1500 as default.")
+        elif option in ("-a", "--alpha"):
+            try:
+                alpha = float(value)
+            except ValueError:
+                print("-a or --alpha must be a number. Taking 0.8 as default.")
+        elif option in ("-e", "--eta"):
+            try:
+                eta = float(value)
+            except ValueError:
+                print("-e or --eta must be a number. Taking 0.2 as default.")
+        elif option in ("-s", "--seeds"):
+            try:
+                seeds = parse_numbers(value, int)
+            except ValueError:
+                print("-s or --seeds must be a list of numbers. Taking 1 as default.")
+        elif option == "--tolerance":
+            try:
+                tol = float(value)
+            except ValueError:
+                print("--tolerance must be a number. Early stopping is disabled.")
+        elif option == "--check-every":
+            try:
+                check_every = max(1, int(value))
+            except ValueError:
+                print("--check-every must be a number. Taking 50 as default.")
+        elif option == "--save-model":
+            model_out = value
+        elif option == "--infer":
+            model_in = value
+        elif option == "--min-count":
+            try:
+                min_count = int(value)
+            except ValueError:
+                print("--min-count must be a number. Taking 1 as default.")
+        elif option == "--min-df":
+            try:
+                min_df = int(value)
+            except ValueError:
+                print("--min-df must be a number. Taking 1 as default.")
+        elif option == "--max-df":
+            try:
+                max_df = text2ldac.parse_document_frequency(value)
+            except ValueError:
+                print("--max-df must be a number, or a proportion up to 1.0. Words are not limited by document frequency.")
+        elif option == "--max-vocab":
+            try:
+                max_vocab = int(value)
+            except ValueError:
+                print("--max-vocab must be a number. The vocabulary size is not limited.")
         elif option in ("-v", "--verbose"):
             verbose = True
         else:
@@ -155,7 +529,8 @@ if __name__ == "__main__":
         sys.exit(3)
 
     # Begins the program
-    plda = PeaceLDA(directory, filter_file, verbose)
+    plda = PeaceLDA(directory, filter_file, verbose, in_memory, jobs, topics, n_iter, alpha, eta, seeds, tol, check_every,
+                    model_out, model_in, min_count, min_df, max_df, max_vocab)
     result = plda.run()
     if result == 0:
         print("SUCCESS!")
@@ -13,9 +13,6 @@ from tkinter.messagebox import showerror
 from tkinter.messagebox import askyesno
 from tkinter.simpledialog import askinteger
 
-# peacewordcloud imports
-import peacewordcloud
-
 if __name__ == '__main__':
 
 	Tk().withdraw() # we don't want a full GUI, so keep the root window from appearing
@@ -69,5 +66,8 @@ if __name__ == '__main__':
 			max_words = 2000
 	print("Max Words:", max_words)
 
-	pwc = peacewordcloud.PeaceWordCloud(pdf_file, filter_file, base_file, output_file, group_file, csv_file, max_words, True)
+	# peacewordcloud imports, after the dialogs so they show up right away
+	import peacewordcloud
+
+	pwc = peacewordcloud.PeaceWordCloud(pdf_file, filter_file, base_file, output_file, group_file, csv_file, max_words, None, None, True)
 	pwc.run()
\ No newline at end of file
@@ -4,27 +4,27 @@
 import os
 import sys
 import getopt
-import re
-import string
 
-# PIL imports
-from PIL import Image
+# cloud renderer imports
+from cloud_renderer import CloudRenderer, read_manifest, render_batch
 
-# numpy imports
-import numpy as np
-
-# wordcloud imports
-from wordcloud import WordCloud
+# frequency index imports
+from frequency_index import read_frecuency_table
 
 def usage():
 	print("""
 USAGE:
 \tpython""", sys.argv[0], """[OPTIONS] -b base_image.png -o result.png
+\tpython""", sys.argv[0], """[OPTIONS] -B manifest.txt [-b base_image.png]
 
 OPTIONS:
 
 \t-f, --frecuency_file=FILE
-\t\tSpecifies a file generated with the R program.
+\t\tSpecifies a file generated with the R program. Its encoding is detected.
+\t\tThe file is expected to be sorted by decreasing frecuency, and only the first lines are read.
+
+\t-u, --unsorted
+\t\tReads the whole frecuency file, which is not sorted, keeping the most frecuent words.
 
 \t-b, --base=FILE
 \t\tSpecifies the name of the image file to be used. This option is mandatory.
@@ -35,6 +35,18 @@ OPTIONS:
 \t-m, --max=NUMBER
 \t\tSpecifies a maximum number of words to be drawn on the wordcloud. Defaults to 2000.
 
+\t--layout-scale=NUMBER
+\t\tPlaces the words over the base image reduced NUMBER times, which is faster for many words.
+\t\tThe image is still created with the size of the base image. Defaults to 1.
+
+\t-B, --batch=FILE
+\t\tSpecifies a manifest to render many wordclouds in one run. Each line has a frecuency file
+\t\tand an output file separated by tabs, and optionally a base image. Lines without a base image use -b.
+\t\tEvery base image is loaded only once.
+
+\t-j, --jobs=NUMBER
+\t\tSpecifies the number of processes used to render a batch. Defaults to 1.
+
 \t-h, --help
 \t\tPrints the usage and exits.
 
@@ -45,14 +57,16 @@ class PeaceWordCloudR():
 	This class processes a PDF file and generates a Wordcloud using PDFMiner.
 	"""
 
-	def __init__(self, base_image, output_file, frecuency_file, max_words):
+	def __init__(self, base_image, output_file, frecuency_file, max_words, layout_scale=1, presorted=True):
 		"""
 		This function creates the PeaceWordCloud object and begins the processing.
 		"""
+		self.presorted = presorted
 		self.base_image = base_image
 		self.output_file = output_file
 		self.frecuency_file = frecuency_file
 		self.max_words = max_words
+		self.layout_scale = layout_scale
 
 	def run(self):
 		"""
@@ -61,22 +75,11 @@ class PeaceWordCloudR():
 		Returns 1 if FAILS.
 		"""
 
-		# abrir el archivo y guardar su contenido
-		frecuency_file = open(self.frecuency_file, encoding="iso8859-1")
-		frecuency_contents = frecuency_file.readlines()
-		frecuency_file.close()
-
-		# Eliminar el salto de línea
-		frecuency_contents = [ content[:-1] for content in frecuency_contents ]
-
-		# crear lista de listas
-		frecuency_contents = [ content.split("\t") for content in frecuency_contents ]		
-
-		# crear lista de tuplas		
-		frecuencies = [ (content[0], int(content[1]) ) for content in frecuency_contents ]		
+		# leer las frecuencias del archivo
+		frecuencies = read_frecuency_table(self.frecuency_file, self.max_words, self.presorted)
 
 		# crear la imagen
-		self.create_image(base_image, frecuencies, output_file, self.max_words)
+		self.create_image(self.base_image, frecuencies, self.output_file, self.max_words)
 
 		return 0
 
@@ -85,21 +88,12 @@ class PeaceWordCloudR():
 		"""
 		This function creates the image with the wordcloud.
 		"""
-		# Read the mask image
-		base_image_mask = np.array(Image.open(base_image))
-
-		wc = WordCloud(background_color="white", max_words=maximum_words, mask=base_image_mask)
-
-		# Generate word cloud
-		wc.generate_from_frequencies(frecuencies)
-
-		# Store to file
-		wc.to_file(output_file)
+		CloudRenderer(maximum_words, layout_scale=self.layout_scale).render(base_image, frecuencies, output_file)
 
 if __name__ == "__main__":
 	# Process all the program arguments
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], "ho:b:m:f:", ["help", "output=", "base=", "max=", "frecuency_file="])
+		opts, args = getopt.getopt(sys.argv[1:], "ho:b:m:f:B:j:u", ["help", "output=", "base=", "max=", "frecuency_file=", "batch=", "jobs=", "layout-scale=", "unsorted"])
 	except getopt.GetoptError as err:
 		# print help information and exit:
 		print(str(err))  # will print something like "option -a not recognized"
@@ -112,6 +106,10 @@ if __name__ == "__main__":
 	base_image = None
 	pdf_file = None
 	max_words = 2000
+	manifest_file = None
+	jobs = 1
+	layout_scale = 1
+	presorted = True
 
 	for option, value in opts:
 		if option in ("-h", "--help"):
@@ -128,9 +126,34 @@ if __name__ == "__main__":
 				max_words = int(value)
 			except ValueError:
 				print("-m or --max must be a number. Taking 2000 as default.")
+		elif option == "--layout-scale":
+			try:
+				layout_scale = max(1, int(value))
+			except ValueError:
+				print("--layout-scale must be a number. Taking 1 as default.")
+		elif option in ("-u", "--unsorted"):
+			presorted = False
+		elif option in ("-B", "--batch"):
+			manifest_file = value
+		elif option in ("-j", "--jobs"):
+			try:
+				jobs = max(1, int(value))
+			except ValueError:
+				print("-j or --jobs must be a number. Taking 1 as default.")
 		else:
 			assert False, "unhandled option"
 
+	# Renders a whole manifest
+	if manifest_file != None:
+		try:
+			tasks = read_manifest(manifest_file, base_image)
+		except ValueError as err:
+			print(str(err))
+			sys.exit(2)
+		failures = render_batch(tasks, max_words, jobs, layout_scale, presorted)
+		print(len(tasks) - failures, "of", len(tasks), "wordclouds created.")
+		sys.exit(0 if failures == 0 else 1)
+
 	# Checks the pdf name and the base image
 	if frecuency_file == None or base_image == None or output_file == None:
 		print("The options -b, -f and -o are mandatory.")
@@ -138,7 +161,7 @@ if __name__ == "__main__":
 		sys.exit(2)
 
 	# Begins the program
-	pwc = PeaceWordCloudR(base_image, output_file, frecuency_file, max_words)
+	pwc = PeaceWordCloudR(base_image, output_file, frecuency_file, max_words, layout_scale, presorted)
 	result = pwc.run()
 	if result == 0:
 		print("SUCCESS!")
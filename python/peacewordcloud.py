@@ -5,36 +5,33 @@ from __future__ import print_function
 import os
 import sys
 import getopt
+import mmap
 import re
-import string
+import multiprocessing
+import itertools
+import glob
+import time
 
-# PDFMiner imports
-from pdfminer.pdfparser import PDFParser, PDFDocument
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from pdfminer.converter import PDFPageAggregator
-from pdfminer.layout import LAParams, LTTextBox, LTTextLine
+# PDFMiner and NLTK are imported only by the functions that use them,
+# so --help, or loading a saved file, does not pay for their import
 
-# NLTK imports
-from nltk import FreqDist
-from nltk.corpus import stopwords
-from nltk.tokenize import MWETokenizer, word_tokenize
+# lexicon imports
+import lexicon
 
-# PIL imports
-from PIL import Image
+# extraction cache imports
+from extraction_cache import ExtractionCache
 
-# numpy imports
-import numpy as np
+# frequency index imports
+from frequency_index import FrequencyIndex
 
-# matplotlib imports
-import matplotlib.pyplot as plt
-
-# wordcloud imports
-from wordcloud import WordCloud
+# cloud renderer imports
+from cloud_renderer import CloudRenderer
 
 def usage():
 	print("""
 USAGE:
 \tpython""", sys.argv[0], """[OPTIONS] [-s input_file.txt] [-p input_file.pdf] -b base_image.png -o result.png
+\tpython""", sys.argv[0], """[OPTIONS] -B pdf_directory -b base_image.png -o clouds/{name}.png
 
 OPTIONS:
 \t-p, --pdf=FILE
@@ -60,31 +57,296 @@ OPTIONS:
 \t-m, --max=NUMBER
 \t\tSpecifies a maximum number of words to be drawn on the wordcloud. Defaults to 2000.
 
+\t--layout-scale=NUMBER
+\t\tPlaces the words over the base image reduced NUMBER times, which is faster for many words.
+\t\tThe image is still created with the size of the base image. Defaults to 1.
+
+\t-k, --top-k=NUMBER
+\t\tSpecifies how many of the most common words are passed to the wordcloud. Defaults to the -m value.
+\t\tThe csv file always has all the words.
+
 \t-s, --save-file
 \t\tSpecifies the name of the file you want to save
 
 \t-l, --load-file
 \t\tSpecifies the name of the file you want to load
 
+\t--pages=RANGE
+\t\tReads only the pages of the pdf in RANGE, numbered from 1, like 10-250, 10- or 10.
+
+\t--fast
+\t\tExtracts the text of the pdf without layout analysis, skipping images and figures.
+\t\tIt is faster, but words can be split or joined differently than with the default extraction.
+
+\t-j, --jobs=NUMBER
+\t\tSpecifies the number of processes used to extract the pdf pages. Defaults to 1.
+\t\tIn batch mode it is the number of pdf files processed at the same time.
+
+\t-B, --batch=DIRECTORY_OR_GLOB
+\t\tCreates a wordcloud for every pdf file of a directory, or matching a glob like "gazettes/*.pdf",
+\t\tin a single run. The filters, groups and base image are loaded only once.
+\t\tIn batch mode -o, and -c, -s and -w if given, are templates where {name} is replaced
+\t\twith the name of each pdf file without extension, like clouds/{name}.png.
+\t\tThey must contain {name}, so every pdf file writes its own files.
+
+\t--summary=FILE
+\t\tIn batch mode, writes the time taken and the error, if any, of every pdf file to FILE.
+
+\t--cache-dir=DIRECTORY
+\t\tSpecifies the directory of the extraction cache. Defaults to ~/.cache/peacewordcloud.
+\t\tThe text extracted from a pdf is reused while the pdf and the extraction settings do not change.
+
+\t--cache-size=MEGABYTES
+\t\tSpecifies the maximum size of the extraction cache. Defaults to 512.
+
+\t--no-cache
+\t\tDisables the extraction cache.
+
+\t-i, --index=FILE
+\t\tSpecifies a frecuency index whose counts are added. Can be repeated.
+\t\tWith indexes, the -p and -l options are optional.
+
+\t-x, --exclude-index=FILE
+\t\tSpecifies a frecuency index whose counts are subtracted. Can be repeated.
+
+\t-w, --write-index=FILE
+\t\tSpecifies a file where the resulting frecuency index is saved. Use a .gz extension to compress it.
+
 \t-h, --help
 \t\tPrints the usage and exits.
 
 	""")
 
+def open_pdf_document(fp):
+	"""
+	This function links a PDF parser and a PDF document over an open file.
+	"""
+	# PDFMiner imports
+	from pdfminer.pdfparser import PDFParser, PDFDocument
+
+	"""
+	DFParser fetch PDF objects from a file stream.
+	It can handle indirect references by referring to
+	a PDF document set by set_document method.
+	It also reads XRefs at the end of every PDF file.
+	"""
+	pdf_parser = PDFParser(fp)
+
+	"""
+	Since a PDF file can be very big, normally it is not loaded at
+	once. So PDF document has to cooperate with a PDF parser in order to
+	dynamically import the data as processing goes.
+	The parsed objects are not cached, so every page can be released once it is processed.
+	"""
+	pdf_doc = PDFDocument(caching=False)
+	pdf_parser.set_document(pdf_doc)
+	pdf_doc.set_parser(pdf_parser)
+	return pdf_doc
+
+def count_pdf_pages(pdf_file):
+	"""
+	This function returns the number of pages of a PDF file.
+	"""
+	fp = open(pdf_file, 'rb')
+	pdf_doc = open_pdf_document(fp)
+	pages = sum(1 for page in pdf_doc.get_pages())
+	fp.close()
+	return pages
+
+# Gap between two characters, relative to their width, that separates two words in fast mode
+FAST_WORD_GAP = 0.3
+
+# Class of the fast mode aggregator, defined on first use
+_fast_page_aggregator = None
+
+def fast_page_aggregator(rsrcmgr):
+	"""
+	This function returns an aggregator that collects the characters of a page without layout analysis.
+	Paths and images are not stored at all, and the characters inside figures
+	stay in their LTFigure, which is skipped by page_text.
+	"""
+	global _fast_page_aggregator
+	if _fast_page_aggregator == None:
+		# PDFMiner imports
+		from pdfminer.converter import PDFPageAggregator
+
+		class FastPageAggregator(PDFPageAggregator):
+
+			def __init__(self, rsrcmgr, pageno=1):
+				PDFPageAggregator.__init__(self, rsrcmgr, pageno=pageno, laparams=None)
+
+			def paint_path(self, gstate, stroke, fill, evenodd, path):
+				return
+
+			def render_image(self, name, stream):
+				return
+
+		_fast_page_aggregator = FastPageAggregator
+	return _fast_page_aggregator(rsrcmgr)
+
+def page_text(layout, word_gap=None):
+	"""
+	This function joins the characters of a page collected by fast_page_aggregator into words.
+	A space is added when the gap to the previous character is wider than word_gap times
+	its width, or when the character is on another line.
+	"""
+	# PDFMiner imports
+	from pdfminer.layout import LTChar
+
+	if word_gap == None:
+		word_gap = FAST_WORD_GAP
+	parts = []
+	previous = None
+	for lt_obj in layout:
+		if not isinstance(lt_obj, LTChar):
+			continue
+		if previous != None:
+			new_line = abs(lt_obj.y0 - previous.y0) > previous.height / 2 or lt_obj.x1 < previous.x0
+			if new_line or lt_obj.x0 - previous.x1 > word_gap * max(lt_obj.width, previous.width):
+				parts.append(" ")
+		parts.append(lt_obj.get_text())
+		previous = lt_obj
+	return "".join(parts)
+
+def iter_pdf_pages(pdf_file, first_page=0, last_page=None, fast=False):
+	"""
+	This generator yields a (page_num, text_boxes) pair for every page in [first_page, last_page).
+	A last_page of None means until the end of the document.
+	Only one page is kept in memory at a time: the parsed objects are not cached
+	and the layout of a page is released when the next one is processed.
+	In fast mode there is no layout analysis, and the text of every page is
+	a single text box, see fast_page_aggregator.
+	"""
+	# PDFMiner imports
+	from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+	from pdfminer.converter import PDFPageAggregator
+	from pdfminer.layout import LAParams, LTTextBox, LTTextLine
+
+	fp = open(pdf_file, 'rb')
+	pdf_doc = open_pdf_document(fp)
+
+	"""
+	ResourceManager facilitates reuse of shared resources
+	such as fonts and images so that large objects are not
+	allocated multiple times.
+	"""
+	rsrcmgr = PDFResourceManager()
+	if fast:
+		pdf_page_aggregator = fast_page_aggregator(rsrcmgr)
+	else:
+		pdf_page_aggregator = PDFPageAggregator(rsrcmgr, laparams=LAParams())
+	interpreter = PDFPageInterpreter(rsrcmgr, pdf_page_aggregator)
+
+	# Process each page in the range and yields its text boxes
+	try:
+		for page_num, page in enumerate(pdf_doc.get_pages()):
+			if page_num < first_page:
+				continue
+			if last_page != None and page_num >= last_page:
+				break
+			interpreter.process_page(page)
+			layout = pdf_page_aggregator.get_result()
+			if fast:
+				text_boxes = [ page_text(layout) ]
+			else:
+				text_boxes = [ lt_obj.get_text() for lt_obj in layout if isinstance(lt_obj, LTTextBox) or isinstance(lt_obj, LTTextLine) ]
+			del layout, page
+			yield page_num, [ text_box.replace('\t', ' ').replace('\n',' ') for text_box in text_boxes ]
+	finally:
+		fp.close()
+
+def extract_page_range(pdf_file, first_page, last_page, show_progress=False, fast=False):
+	"""
+	This generator yields the text boxes of the pages in [first_page, last_page).
+	A last_page of None means until the end of the document.
+	Every call opens its own parser so it can be run in a worker process.
+	"""
+	for page_num, text_boxes in iter_pdf_pages(pdf_file, first_page, last_page, fast):
+		for text_box in text_boxes:
+			yield text_box
+		if show_progress:
+			print("Page Num:", page_num + 1, file=sys.stderr, end="\r")
+
+def parse_page_range(value):
+	"""
+	This function parses a page range like "10-250", "10-" or "10", with pages numbered from 1,
+	and returns it as the (first_page, last_page) arguments of extract_page_range.
+	Raises ValueError if the range is not valid.
+	"""
+	first, separator, last = value.partition("-")
+	first_page = int(first) - 1
+	if separator == "":
+		last_page = first_page + 1
+	elif last.strip() == "":
+		last_page = None
+	else:
+		last_page = int(last)
+	if first_page < 0 or (last_page != None and last_page <= first_page):
+		raise ValueError("Invalid page range: " + value)
+	return first_page, last_page
+
+def _extract_page_range_worker(args):
+	"""
+	Pool entry point for extract_page_range.
+	"""
+	return list(extract_page_range(*args))
+
+def read_pdf_file_parallel(pdf_file, jobs, pages_per_task=32, fast=False, first_page=0, last_page=None):
+	"""
+	This generator splits the pages in [first_page, last_page) of the PDF across jobs worker processes.
+	The text boxes are yielded back in page order, so the result is the same as the serial path.
+	Pages are handed out in small ranges so only a few ranges are held in memory at once.
+	The pages are counted only when last_page is None.
+	"""
+	pages = last_page if last_page != None else count_pdf_pages(pdf_file)
+	chunk = max(1, min(pages_per_task, -(-(pages - first_page) // jobs)))
+	ranges = [ (pdf_file, first, min(first + chunk, pages), False, fast) for first in range(first_page, pages, chunk) ]
+
+	pool = multiprocessing.Pool(min(jobs, max(1, len(ranges))))
+	try:
+		for done, contents in enumerate(pool.imap(_extract_page_range_worker, ranges)):
+			for text_box in contents:
+				yield text_box
+			print("Page Num:", ranges[done][2], file=sys.stderr, end="\r")
+	finally:
+		pool.terminate()
+		pool.join()
+
+class TextNormalizer():
+	"""
+	This class cleans whole text blocks in a single regular expression pass.
+	Everything that is not a spanish letter or a word separator is removed, which
+	includes the punctuation marks (!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~¡¿”“•\r´), and the
+	result is lowered.
+	"""
+
+	def __init__(self, letters="a-zA-ZñÑáéíóúÁÉÍÓÚ"):
+		"""
+		This function compiles the pattern once, so it can be reused for every block.
+		"""
+		self.pattern = re.compile("[^" + letters + " \n]")
+
+	def normalize(self, text):
+		"""
+		This function returns text without punctuation nor non alphabetic characters, in lowercase.
+		"""
+		return self.pattern.sub("", text).lower()
+
 class PeaceWordCloud():
 	"""
 	This class processes a PDF file and generates a Wordcloud using PDFMiner.
 	"""
 
-	def __init__(self, pdf_file, filters_file, base_image, output_file, groups_file, csv_file, max_words, load_file, save_file, verbose):
+	def __init__(self, pdf_file, filters_file, base_image, output_file, groups_file, csv_file, max_words, load_file, save_file, verbose, jobs=1, shared_lexicon=None, cache=None, index_files=(), exclude_files=(), index_out=None, layout_scale=1, top_k=None, fast=False, pages=None, shared_groups=None, renderer=None):
 		"""
 		This function creates the PeaceWordCloud object and begins the processing.
 		"""
 		self.verbose = verbose
-		self.groups = self.read_file_as_lower(groups_file)
-		self.printv("GROUPS:", self.groups)
-		self.filters = self.read_file_as_lower(filters_file)
-		self.printv("FILTERS:", self.filters)
+		# The lexicon can be shared by several objects, so the stopwords are loaded once
+		if shared_lexicon == None:
+			shared_lexicon = lexicon.Lexicon.load([filters_file])
+		self.lexicon = shared_lexicon
+		self.printv("FILTERS:", sorted(self.lexicon.filters))
 
 		self.pdf_file = pdf_file
 		self.base_image = base_image
@@ -93,178 +355,184 @@ class PeaceWordCloud():
 		self.max_words = max_words
 		self.load_file = load_file
 		self.save_filename = save_file
+		self.jobs = jobs
+		self.cache = cache
+		# The groups and the renderer, with its masks, can be shared too
+		if shared_groups == None:
+			shared_groups = lexicon.GroupMatcher.load(groups_file, cache.directory if cache != None else None)
+		self.groups = shared_groups
+		self.renderer = renderer
+		self.printv("GROUPS:", len(self.groups))
+		self.index_files = index_files
+		self.exclude_files = exclude_files
+		self.index_out = index_out
+		self.layout_scale = layout_scale
+		self.top_k = top_k
+		self.fast = fast
+		self.pages = pages
 
 	def run(self):
 		"""
 		This function does the Job. Just to separate the job from the construction of the object.
+		The text is processed one block at a time, so memory depends on the page size, not the document size.
 		Returns 0 if SUCCESS.
 		Returns 1 if FAILS.
 		"""
-		if self.load_file == None:
-			file_contents = self.read_pdf_file(self.pdf_file)
-		else:
-			file_contents = self.process_saved_file(self.load_file)
-
-		if len(file_contents) == 0:
-			print("Couldn't read text from the pdf file!")
-			return 1
-
-		# Begin with some word processing
-		file_contents = [ self.remove_punctuation(word) for word in file_contents ]
-		file_contents = self.remove_no_alpha(file_contents)
-		file_contents = [ word.lower() for word in file_contents ]
-
-		if len(file_contents) == 0:
-			print("Couldn't remove no alpha")
-			print("file_contents:", file_contents)
-			return 1
-
-		if self.save_filename != None:
-			flatten = lambda l: [item for sublist in l for item in sublist]
-			file_contents2 = flatten([i.split() for i in file_contents])
-			file_contents2 = self.remove_filters(file_contents2, self.filters)
-			filename = self.save_file(" ".join(file_contents2))
-
-		frecuencies = self.frequency_analysis(file_contents, self.groups, self.filters)
-
-		if len(frecuencies) == 0:
+		index = FrequencyIndex()
+		if self.pdf_file != None or self.load_file != None:
+			frecuencies = self.read_frecuencies()
+			if frecuencies == None:
+				return 1
+			# The FreqDist is the base of the index, so it is not copied
+			index = FrequencyIndex.from_counter(frecuencies)
+
+		# Adds and subtracts the stored indexes
+		index.merge(FrequencyIndex.load_all(self.index_files))
+		index.subtract(FrequencyIndex.load_all(self.exclude_files))
+
+		if len(index) == 0:
 			print("Couldn't get frecuencies")
-			print("file_contents:", file_contents)
 			return 1
 
-		self.create_image(self.base_image, frecuencies, self.output_file, self.max_words)
+		if self.index_out != None:
+			index.save(self.index_out)
+
+		# The counts go to the renderer as they are, it selects the top words itself
+		self.create_image(self.base_image, index.counts, self.output_file, self.max_words)
 		if self.csv_file != None:
-			self.export_csv(frecuencies)
+			self.export_csv(index.most_common())
 		return 0
 
-	def remove_filters(self, words, filters):
-		return [ word for word in words if word not in filters ]
-
-	def remove_no_alpha(self, text):
-		return [ re.sub(r"[^a-zA-ZñÑáéíóúÁÉÍÓÚ ]","", word) for word in text]
-
-	def read_file_as_lower(self, current_file):
+	def top_words(self):
 		"""
-		This function reads a file and returns a list of lines in lowercase.
+		This function returns how many of the most common words are passed to the wordcloud.
+		None means all of them.
 		"""
-		def lowers_removes_linesep(some_string):
-			if some_string.endswith("\n"):
-				some_string = some_string[:-1]
-			return some_string.lower()
+		if self.top_k != None:
+			return self.top_k
+		return self.max_words
 
-		lines = []
-		if current_file != None:
-			fp = open (current_file,'r', encoding="utf-8")
-			lines = fp.readlines()
-			fp.close()
-			lines = [ lowers_removes_linesep(line) for line in lines ]
-		return lines
-	
-	def read_pdf_file(self, pdf_file):
+	def read_frecuencies(self):
 		"""
-		This function reads the PDF, obtains the words and merges them into a single string.
+		This function reads the pdf or the saved file and returns its FreqDist.
+		Returns None if no text could be read.
 		"""
+		if self.load_file == None:
+			blocks = self.read_pdf_file(self.pdf_file)
+		else:
+			blocks = self.process_saved_file(self.load_file)
 
-		fp = open (pdf_file,'rb')
+		saved_file = None
+		if self.save_filename != None:
+			saved_file = open(self.save_filename, "w", encoding="utf-8")
 
+		self.blocks_read = 0
+		try:
+			frecuencies = self.frequency_analysis(self.iter_words(blocks, self.lexicon, saved_file), self.groups)
+		finally:
+			if saved_file != None:
+				saved_file.close()
+
+		if self.blocks_read == 0:
+			print("Couldn't read text from the pdf file!")
+			return None
+		return frecuencies
+
+	def iter_words(self, blocks, words_lexicon, saved_file=None):
 		"""
-		DFParser fetch PDF objects from a file stream.
-		It can handle indirect references by referring to
-		a PDF document set by set_document method.
-		It also reads XRefs at the end of every PDF file.
+		This generator cleans one text block at a time and yields its list of filtered words.
+		If saved_file is given, the filtered words are also written to it.
 		"""
-		pdf_parser = PDFParser(fp)
+		normalizer = TextNormalizer()
+		separator = ""
+		for block in blocks:
+			self.blocks_read += 1
+			# Begin with some word processing
+			words = words_lexicon.remove_filters(normalizer.normalize(block).split())
+			if len(words) == 0:
+				continue
+
+			if saved_file != None:
+				saved_file.write(separator + " ".join(words))
+				separator = " "
+			yield words
 
+	def read_pdf_file(self, pdf_file):
 		"""
-		Since a PDF file can be very big, normally it is not loaded at
-		once. So PDF document has to cooperate with a PDF parser in order to
-		dynamically import the data as processing goes.
+		This function reads the PDF and returns an iterator over its text boxes.
+		When jobs is greater than 1 the pages are split across several worker processes.
+		If there is a cache, the text boxes are read from it or stored in it.
 		"""
-		pdf_doc = PDFDocument()
-		pdf_parser.set_document(pdf_doc)
-		pdf_doc.set_parser(pdf_parser)
-
+		if self.cache != None:
+			key = self.cache.key(pdf_file, self.extraction_settings())
+			text_boxes = self.cache.get(key)
+			if text_boxes != None:
+				self.printv("EXTRACTION CACHE HIT:", key)
+				return text_boxes
+			return self.cache.store(key, self.extract_text_boxes(pdf_file))
+		return self.extract_text_boxes(pdf_file)
+
+	def extract_text_boxes(self, pdf_file):
 		"""
-		ResourceManager facilitates reuse of shared resources
-		such as fonts and images so that large objects are not
-		allocated multiple times.
+		This function returns an iterator over the text boxes extracted with pdfminer.
 		"""
-		rsrcmgr = PDFResourceManager()
-		pdf_page_aggregator = PDFPageAggregator(rsrcmgr, laparams=LAParams())
-		interpreter = PDFPageInterpreter(rsrcmgr, pdf_page_aggregator)
+		first_page, last_page = self.pages if self.pages != None else (0, None)
+		if self.jobs > 1:
+			return read_pdf_file_parallel(pdf_file, self.jobs, fast=self.fast, first_page=first_page, last_page=last_page)
+		return extract_page_range(pdf_file, first_page, last_page, show_progress=True, fast=self.fast)
 
-		# Process each page contained in the document and adds them to the file_contents string
-		file_contents = []
-		page_num = 0
-		for page in pdf_doc.get_pages():
-			interpreter.process_page(page)
-			layout = pdf_page_aggregator.get_result()
-			for lt_obj in layout:
-				if isinstance(lt_obj, LTTextBox) or isinstance(lt_obj, LTTextLine):
-					file_contents.append( lt_obj.get_text().replace('\t', ' ').replace('\n',' ') )
-			page_num = page_num + 1
-			print("Page Num:", page_num, file=sys.stderr, end="\r")
-
-		fp.close()
-		self.printv("FILE_CONTENTS_LENGTH in CHARACTERS: ", str(len(file_contents)))
-		return file_contents
-
-	def frequency_analysis(self, file_contents, groups, filters):
+	def extraction_settings(self):
+		"""
+		This function returns the settings that change the extracted text, used as part of the cache key.
+		"""
+		if self.fast:
+			settings = { "mode": "fast", "word_gap": FAST_WORD_GAP }
+		else:
+			# PDFMiner imports
+			from pdfminer.layout import LAParams
+			settings = { "laparams": sorted(vars(LAParams()).items()) }
+		if self.pages != None:
+			settings["pages"] = self.pages
+		return settings
+
+	def frequency_analysis(self, words, groups):
 		"""
 		This function uses the NLTK library to make a frecuency analisis.
-		Uses groups as tokens.
+		Uses groups, a GroupMatcher, to join the groups of words as tokens.
+		Consumes an iterable of word lists and returns a running FreqDist.
 		"""
-
-		flatten = lambda l: [item for sublist in l for item in sublist]
-		file_contents = flatten( [ i.split() for i in file_contents ] )
-		file_contents = self.remove_filters(file_contents, filters)
-		
-		# Return a tokenized copy of "pdt_string", using NLTK's recommended word tokenizer
-		tokenizer = MWETokenizer()
-		for group in groups:
-			tokenizer.add_mwe(group.split(" "))
-		tokens = tokenizer.tokenize(file_contents)
+		# NLTK imports
+		from nltk import FreqDist
 
 		# Filters the spanish stopwords (hemos, están, estuvimos, etc.)
-		stopwords_esp = stopwords.words('spanish')
-		tokens = [w for w in tokens if w not in stopwords_esp]
+		stopwords_esp = self.lexicon.stopwords
 
-		# Gets the most common words
-		return FreqDist(tokens).most_common()
+		frecuencies = FreqDist()
+		for tokens in groups.iter_tokens(words):
+			frecuencies.update(w for w in tokens if w not in stopwords_esp)
+		return frecuencies
 
 	def create_image(self, base_image, frecuencies, output_file, maximum_words):
 		"""
 		This function creates the image with the wordcloud.
-		Returns frecuencies
 		"""
-		# Read the mask image
-		base_image_mask = np.array(Image.open(base_image))
+		renderer = self.renderer
+		if renderer == None:
+			renderer = CloudRenderer(maximum_words, layout_scale=self.layout_scale)
+		renderer.render(base_image, frecuencies, output_file, self.top_words())
 
-		wc = WordCloud(background_color="white", max_words=maximum_words, mask=base_image_mask)
-
-		# Generate word cloud
-		wc.generate_from_frequencies(frecuencies)
-
-		# Store to file
-		wc.to_file(output_file)
-
-	def remove_punctuation(self, text):
-		"""
-		This function removes all the punctuation marks from text.
-		"""
-		# The punctuation variable has the following caracters: !"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~¡¿”“•\r´
-		punctuation = string.punctuation + '¡¿”“•\r\n´'
-		# Filters the punctuation marks and lowers all the words
-		transtable = text.maketrans('', '', punctuation)
-		return text.translate(transtable)
-
-	def export_csv(self, frecuencies):
+	def export_csv(self, frecuencies, chunk_size=10000):
 		"""
 		This function creates a csv from the frecuencies.
+		The rows are written in chunks of chunk_size lines.
 		"""
+		frecuencies = iter(frecuencies)
 		f = open(self.csv_file, "w", encoding="utf-8")
-		for frecuency in frecuencies:
-			f.write(frecuency[0] + "," + str(frecuency[1]) + "\n")
+		while True:
+			chunk = [ word + "," + str(count) + "\n" for word, count in itertools.islice(frecuencies, chunk_size) ]
+			if len(chunk) == 0:
+				break
+			f.write("".join(chunk))
 		f.close()
 
 	def printv(self, *text):
@@ -274,23 +542,132 @@ class PeaceWordCloud():
 		if self.verbose == True:
 			print(text)
 
-	def save_file(self, contents):
-		new_file = open(self.save_filename, "w", encoding="utf-8")
-		new_file.writelines(contents)
-		new_file.close()
+	def process_saved_file(self, saved_file, chunk_size=1 << 20):
+		"""
+		This generator yields the saved file in blocks of about chunk_size bytes.
+		The file is memory mapped and every block ends on a word separator, so loading
+		is linear in the size of the file, even when it is a single line.
+		"""
+		to_read_saved_file = open(saved_file, "rb")
+		try:
+			if os.fstat(to_read_saved_file.fileno()).st_size == 0:
+				return
+			contents = mmap.mmap(to_read_saved_file.fileno(), 0, access=mmap.ACCESS_READ)
+			try:
+				start = 0
+				size = len(contents)
+				while start < size:
+					end = self.find_separator(contents, start + chunk_size, size)
+					yield contents[start:end].decode("utf-8")
+					start = end
+			finally:
+				contents.close()
+		finally:
+			to_read_saved_file.close()
+
+	def find_separator(self, contents, position, size):
+		"""
+		This function returns the position just after the first space or line break
+		found from position, or size if there is none.
+		"""
+		if position >= size:
+			return size
+		ends = [ contents.find(separator, position) for separator in (b" ", b"\n") ]
+		ends = [ end for end in ends if end != -1 ]
+		if len(ends) == 0:
+			return size
+		return min(ends) + 1
+
+def find_batch_files(pattern):
+	"""
+	This function returns the sorted list of files of a batch.
+	pattern is a directory, whose pdf files are taken, or a glob like "gazettes/*.pdf".
+	"""
+	if os.path.isdir(pattern):
+		pattern = os.path.join(pattern, "*.pdf")
+	return sorted(glob.glob(pattern))
+
+def expand_template(template, pdf_file):
+	"""
+	This function replaces {name} in template with the name of pdf_file without its extension.
+	Returns None if template is None.
+	"""
+	if template == None:
+		return None
+	return template.replace("{name}", os.path.splitext(os.path.basename(pdf_file))[0])
+
+# Options, lexicon, groups and renderer of the current batch worker process
+_batch_worker = None
+
+def _init_batch_worker(options, shared_lexicon, shared_groups):
+	global _batch_worker
+	renderer = CloudRenderer(options["max_words"], layout_scale=options["layout_scale"])
+	_batch_worker = (options, shared_lexicon, shared_groups, renderer)
 
-	def process_saved_file(self, saved_file):
-		contents = []
-		to_read_saved_file = open(saved_file, "r", encoding="utf-8")
-		for line in to_read_saved_file.readlines():
-			contents = contents + line.split(" ")
-		to_read_saved_file.close()
-		return contents
+def _batch_task(pdf_file):
+	"""
+	This function creates the wordcloud of a batch file with the objects of the worker.
+	Returns the pdf file, the output file, the seconds taken and None, or the error message if it fails.
+	"""
+	options, shared_lexicon, shared_groups, renderer = _batch_worker
+	output_file = expand_template(options["output_file"], pdf_file)
+	start = time.time()
+	try:
+		pwc = PeaceWordCloud(pdf_file, None, options["base_image"], output_file, None,
+			expand_template(options["csv_file"], pdf_file), options["max_words"], None,
+			expand_template(options["save_file"], pdf_file), options["verbose"],
+			shared_lexicon=shared_lexicon, cache=options["cache"], index_files=options["index_files"],
+			exclude_files=options["exclude_files"], index_out=expand_template(options["index_out"], pdf_file),
+			layout_scale=options["layout_scale"], top_k=options["top_k"], fast=options["fast"],
+			pages=options["pages"], shared_groups=shared_groups, renderer=renderer)
+		error = None if pwc.run() == 0 else "Couldn't get frecuencies"
+	except Exception as err:
+		error = str(err)
+	return pdf_file, output_file, time.time() - start, error
+
+def run_batch(pdf_files, options, shared_lexicon, shared_groups, jobs=1, summary_file=None):
+	"""
+	This function creates a wordcloud for every pdf file in a single process, or in a pool
+	of jobs worker processes. The lexicon and the groups are loaded once and handed to the
+	workers, and every worker loads each mask only once.
+	The output files come from the templates of options, see expand_template.
+	The time and error of every file are printed, and written to summary_file if given.
+	Returns the number of failed files.
+	"""
+	failures = 0
+	if jobs > 1:
+		pool = multiprocessing.Pool(jobs, _init_batch_worker, (options, shared_lexicon, shared_groups))
+		results = pool.imap_unordered(_batch_task, pdf_files)
+	else:
+		pool = None
+		_init_batch_worker(options, shared_lexicon, shared_groups)
+		results = (_batch_task(pdf_file) for pdf_file in pdf_files)
+
+	summary = None
+	if summary_file != None:
+		summary = open(summary_file, "w", encoding="utf-8")
+		summary.write("pdf\toutput\tseconds\terror\n")
+	try:
+		for pdf_file, output_file, seconds, error in results:
+			if error == None:
+				print("Created:", output_file, "(%.2f s)" % seconds)
+			else:
+				failures += 1
+				print("Failed:", pdf_file, error, file=sys.stderr)
+			if summary != None:
+				summary.write(pdf_file + "\t" + output_file + "\t" + ("%.3f" % seconds) + "\t" + (error if error != None else "") + "\n")
+	finally:
+		if summary != None:
+			summary.close()
+		if pool != None:
+			pool.close()
+			pool.join()
+	return failures
 
 if __name__ == "__main__":
 	# Process all the program arguments
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], "vho:f:p:b:g:m:c:s:l:", ["verbose","help", "output=", "filters=", "pdf=", "base=", "groups=", "max=", "csv=", "save-file=","load-file="])
+		opts, args = getopt.getopt(sys.argv[1:], "vho:f:p:b:g:m:c:s:l:j:i:x:w:k:B:", ["verbose","help", "output=", "filters=", "pdf=", "base=", "groups=", "max=", "csv=", "save-file=","load-file=", "jobs=", "cache-dir=", "cache-size=", "no-cache", "index=", "exclude-index=", "write-index=", "layout-scale=", "top-k=", "fast", "pages=", "batch=", "summary="])
 	except getopt.GetoptError as err:
 		# print help information and exit:
 		print(str(err))  # will print something like "option -a not recognized"
@@ -308,6 +685,19 @@ if __name__ == "__main__":
 	csv_file = None
 	max_words = 2000
 	load_file=None
+	jobs = 1
+	use_cache = True
+	cache_dir = None
+	cache_size = 512
+	index_files = []
+	exclude_files = []
+	index_out = None
+	layout_scale = 1
+	top_k = None
+	fast = False
+	pages = None
+	batch = None
+	summary_file = None
 	for option, value in opts:
 		if option in ("-h", "--help"):
 			usage()
@@ -335,6 +725,47 @@ if __name__ == "__main__":
 				max_words = int(value)
 			except ValueError:
 				print("-m or --max must be a number. Taking 2000 as default.")
+		elif option in ("-j", "--jobs"):
+			try:
+				jobs = max(1, int(value))
+			except ValueError:
+				print("-j or --jobs must be a number. Taking 1 as default.")
+		elif option == "--cache-dir":
+			cache_dir = value
+		elif option == "--cache-size":
+			try:
+				cache_size = int(value)
+			except ValueError:
+				print("--cache-size must be a number. Taking 512 as default.")
+		elif option == "--no-cache":
+			use_cache = False
+		elif option == "--layout-scale":
+			try:
+				layout_scale = max(1, int(value))
+			except ValueError:
+				print("--layout-scale must be a number. Taking 1 as default.")
+		elif option in ("-k", "--top-k"):
+			try:
+				top_k = max(1, int(value))
+			except ValueError:
+				print("-k or --top-k must be a number. Taking the -m value as default.")
+		elif option in ("-i", "--index"):
+			index_files.append(value)
+		elif option in ("-x", "--exclude-index"):
+			exclude_files.append(value)
+		elif option in ("-w", "--write-index"):
+			index_out = value
+		elif option == "--fast":
+			fast = True
+		elif option in ("-B", "--batch"):
+			batch = value
+		elif option == "--summary":
+			summary_file = value
+		elif option == "--pages":
+			try:
+				pages = parse_page_range(value)
+			except ValueError:
+				print("--pages must be a range like 10-250. Reading all the pages.")
 		else:
 			assert False, "unhandled option"
 
@@ -344,14 +775,43 @@ if __name__ == "__main__":
 		usage()
 		sys.exit(2)
 
+	cache = None
+	if use_cache:
+		cache = ExtractionCache(cache_dir, cache_size * 1024 * 1024)
+
+	# Creates the wordclouds of a whole batch
+	if batch != None:
+		if "{name}" not in output_file:
+			print("In batch mode -o must be a template with {name}, like clouds/{name}.png.")
+			sys.exit(2)
+		# Every file must write its own csv, saved file and index
+		for option, template, example in (("-c", csv_file, "{name}.csv"), ("-s", save_file, "{name}.txt"), ("-w", index_out, "{name}.gz")):
+			if template != None and "{name}" not in template:
+				print("In batch mode " + option + " must be a template with {name}, like " + example + ".")
+				sys.exit(2)
+		pdf_files = find_batch_files(batch)
+		if len(pdf_files) == 0:
+			print("No pdf files found in", batch)
+			sys.exit(3)
+		options = { "base_image": base_image, "output_file": output_file, "csv_file": csv_file,
+			"save_file": save_file, "index_out": index_out, "max_words": max_words, "verbose": verbose,
+			"cache": cache, "index_files": index_files, "exclude_files": exclude_files,
+			"layout_scale": layout_scale, "top_k": top_k, "fast": fast, "pages": pages }
+		shared_lexicon = lexicon.Lexicon.load([filter_file])
+		shared_groups = lexicon.GroupMatcher.load(group_file, cache.directory if cache != None else None)
+		start = time.time()
+		failures = run_batch(pdf_files, options, shared_lexicon, shared_groups, jobs, summary_file)
+		print(len(pdf_files) - failures, "of", len(pdf_files), "wordclouds created in %.2f s." % (time.time() - start))
+		sys.exit(0 if failures == 0 else 1)
+
 	# Checks the base image and output file
-	if pdf_file == None and load_file == None:
-		print("You must specify a pdf or a txt file.")
+	if pdf_file == None and load_file == None and len(index_files) == 0:
+		print("You must specify a pdf, a txt file or a frecuency index.")
 		usage()
 		sys.exit(3)
 
 	# Begins the program
-	pwc = PeaceWordCloud(pdf_file, filter_file, base_image, output_file, group_file, csv_file, max_words, load_file, save_file, verbose)
+	pwc = PeaceWordCloud(pdf_file, filter_file, base_image, output_file, group_file, csv_file, max_words, load_file, save_file, verbose, jobs, cache=cache, index_files=index_files, exclude_files=exclude_files, index_out=index_out, layout_scale=layout_scale, top_k=top_k, fast=fast, pages=pages)
 	result = pwc.run()
 	if result == 0:
 		print("SUCCESS!")
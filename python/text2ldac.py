@@ -1,10 +1,14 @@
 import argparse
 import codecs
+import heapq
+import itertools
+import multiprocessing
 import os
-import operator
 import string
 import sys
 
+import lexicon
+
 def init_parser():
     '''
     Returns an argument parser configured with options for this program
@@ -23,13 +27,27 @@ def init_parser():
     parser.add_argument('-e', '--extension', action='store', dest='extension',
             default='.txt',
             help='extension of the files you are looking for. Default: %(default)s')
-    #TODO minoccurrence should work for the overall occurrence
     parser.add_argument('--minoccurrence', action='store',
             dest='minoccurrence', type=int, default=1,
             help='Minimum occurrences a word needs at least once in one document to be taken into account.')
+    parser.add_argument('--mincount', action='store',
+            dest='mincount', type=int, default=1,
+            help='Minimum overall occurrences a word needs to be taken into account.')
+    parser.add_argument('--mindf', action='store',
+            dest='mindf', type=int, default=1,
+            help='Minimum number of documents a word needs to appear in.')
+    parser.add_argument('--maxdf', action='store',
+            dest='maxdf', type=parse_document_frequency, default=None,
+            help='Maximum number of documents a word can appear in, or proportion of the documents if it has a decimal point, like 0.9 or 1.0.')
+    parser.add_argument('--maxvocab', action='store',
+            dest='maxvocab', type=int, default=None,
+            help='Keep only the given number of most frequent words.')
     parser.add_argument('--minlength', action='store',
             dest='minlength', type=int, default=1,
             help='Minimum length a word needs to be taken into account.')
+    parser.add_argument('-j', '--jobs', action='store',
+            dest='jobs', type=int, default=1,
+            help='Number of processes used to tokenize the documents. Default: %(default)s')
     #stopwords
     parser.add_argument('--stopwords', action='store', dest='stopword_file',
             help='Remove the stopwords given in the stopword file (one line per stopword).')
@@ -41,6 +59,20 @@ def init_parser():
     return parser.parse_args()
 
 
+def parse_document_frequency(value):
+    '''
+    returns value as an int number of documents, or as a float proportion of
+    the documents if it has a decimal point. Raises ValueError if a
+    proportion is not in (0, 1].
+    '''
+    try:
+        return int(value)
+    except ValueError:
+        proportion = float(value)
+    if not 0.0 < proportion <= 1.0:
+        raise ValueError('A proportion of documents must be in (0, 1]: ' + value)
+    return proportion
+
 def get_filenames(directory, extension):
     '''
     Search for files in the directory ending in EXTENSION and return the full
@@ -61,19 +93,11 @@ def clean_word(word):
 
 def load_stopwords(stopword_filename):
     '''
-    returns a set of stopwords found line by line in the stopwords file
+    returns a lexicon with the stopwords found line by line in the stopwords
+    file. Lines with more than one word are removed as whole phrases.
     '''
-    stopwords = set()
-
     with codecs.open(stopword_filename, 'r', 'utf-8') as sf:
-        for line in sf:
-            if len(line.split()) != 1:
-                print('ignoring line with more than one stopword:\n"{0}"'.format(
-                    line))
-                continue
-            stopwords.add(line.strip())
-
-    return stopwords
+        return lexicon.Lexicon(filters=[line.strip() for line in sf])
 
 def write_document_map_file(fnames, dmap_fname):
     """
@@ -83,99 +107,257 @@ def write_document_map_file(fnames, dmap_fname):
         for title in fnames:
             d_file.write(title + '\n')
 
-def reindex(word_id_dict, min_index):
+def count_document_words(docname, config, stopwords):
     """
-    re-index the word_id for word_id pairs to guarantee that the max
-    index of the word matches/reflects number of words in word dict
+    count the occurrences of every word of a document. The returned dict
+    keeps the words in order of first appearance. If the document has
+    encoding errors, the words read before the error are kept.
     """
-    num_word_shifts = 0
-    for word in word_id_dict:
-        cur_index = word_id_dict[word]
-
-        if cur_index > min_index:
-            word_id_dict[word] = min_index + num_word_shifts
-            num_word_shifts += 1
+    freq_dict = dict()
+    minlength = config['minlength']
 
-def generate_dat_lines_and_word_ids(fnames, config):
-    dat_lines = [] #.dat file output
-    word_id_dict = dict()
-    used_docs = [] #needed to generate .dmap file
-
-    for docname in fnames:
-        freq_dict = dict()
-        new_words = set()
-
-        try:
-            with codecs.open(docname, 'r', 'utf-8') as doc:
-                for line in doc:
-                    for word in line.split():
-                        word = clean_word(word)
-
-                        if len(word) < config['minlength'] or word in config['stopwords']:
-                            continue
-
-                        #word occurrs for the first time
-                        if not word in word_id_dict:
-                            freq_dict[word] = 1
-                            word_id_dict[word] = len(word_id_dict)
-                            new_words.add(word)
-                        #word may be in word_id_dict but not yet in freq_dict
-                        else:
-                            freq = freq_dict.setdefault(word, 0)
-                            freq_dict[word] = freq + 1
-        except UnicodeDecodeError as u_error:
-            print('Document "{0}" has encoding errors and is ignored!\n{1}'.format(
-                docname, u_error))
+    try:
+        with codecs.open(docname, 'r', 'utf-8') as doc:
+            for line in doc:
+                words = stopwords.remove_phrases(
+                        [clean_word(word) for word in line.split()])
+                for word in words:
+                    if len(word) < minlength or word in stopwords:
+                        continue
+                    freq_dict[word] = freq_dict.get(word, 0) + 1
+    except UnicodeDecodeError as u_error:
+        print('Document "{0}" has encoding errors and is ignored!\n{1}'.format(
+            docname, u_error))
+
+    return freq_dict
+
+#(config, stopwords) of the current worker process
+_worker_args = None
+
+def _init_count_worker(config, stopwords):
+    global _worker_args
+    _worker_args = (config, stopwords)
+
+def _count_document_worker(docname):
+    return count_document_words(docname, *_worker_args)
+
+def iter_document_counts(fnames, config, stopwords):
+    """
+    yield the word counts of every document, in the order of fnames. With
+    config['jobs'] greater than 1 the documents are tokenized by a process
+    pool; the results still come back in the order of fnames, so merging
+    them gives the same word ids whatever the number of workers.
+    """
+    jobs = config.get('jobs', 1)
+    if jobs <= 1:
+        for docname in fnames:
+            yield count_document_words(docname, config, stopwords)
+        return
+
+    worker_config = {'minlength': config['minlength']}
+    pool = multiprocessing.Pool(jobs, _init_count_worker,
+            (worker_config, stopwords))
+    try:
+        for freq_dict in pool.imap(_count_document_worker, fnames):
+            yield freq_dict
+    finally:
+        pool.terminate()
+        pool.join()
 
+def iter_document_words(fnames, config, stopwords):
+    """
+    yield (docname, entries) for every document that contributes words, in
+    the order of fnames, where entries is a list of (word, freq) pairs in
+    order of first appearance. Words that do not reach minoccurrence in the
+    document are left out.
+    """
+    minoccurrence = config['minoccurrence']
 
+    doc_counts = iter_document_counts(fnames, config, stopwords)
+    for doc_index, (docname, freq_dict) in enumerate(zip(fnames, doc_counts)):
         if len(freq_dict)==0: #did the document contribute anything?
             print('Document "{0}" (#{1}) seems to be empty and is ignored!'.format(
-                docname,fnames.index(docname)))
+                docname, doc_index))
             continue
-        else:
-            used_docs.append(docname)
 
-        #remove words that do not reach minoccurrence
-        remove_list = [word for word in freq_dict.keys() if\
-            freq_dict[word] < config['minoccurrence']]
-        #smallest index of a word that is removed
-        remove_word_min_index = len(word_id_dict)
+        yield docname, [(word, freq) for word, freq in freq_dict.items()
+                if freq >= minoccurrence]
 
-        for word in remove_list:
-            freq_dict.pop(word)
-            #if they are new also remove them from word_id_dict
-            if word in new_words:
-                word_index = word_id_dict[word]
-                if word_index < remove_word_min_index:
-                    remove_word_min_index = word_index
-                word_id_dict.pop(word)
-        reindex(word_id_dict, remove_word_min_index)
+def pruning_requested(config):
+    """
+    tell if config asks for a global pruning of the vocabulary
+    """
+    return (config.get('mincount', 1) > 1 or config.get('mindf', 1) > 1 or
+            config.get('maxdf') is not None or
+            config.get('maxvocab') is not None)
 
-        dat_line =  '' #line for the .dat file
+def prune_vocabulary(documents, config):
+    """
+    remove from the (docname, entries) documents the words whose overall
+    occurrences are below config['mincount'], whose document frequency is
+    below config['mindf'] or above config['maxdf'], and keep only the
+    config['maxvocab'] most frequent words. A float maxdf is a proportion
+    of the documents, see parse_document_frequency. Documents left without
+    words are dropped. The vocabulary size before and after the pruning is
+    stored in config['pruned_vocabulary']. Raises ValueError if no word is
+    left.
+    """
+    counts = dict()
+    dfs = dict()
+    for docname, entries in documents:
+        for word, freq in entries:
+            counts[word] = counts.get(word, 0) + freq
+            dfs[word] = dfs.get(word, 0) + 1
+
+    mincount = config.get('mincount', 1)
+    mindf = config.get('mindf', 1)
+    maxdf = config.get('maxdf')
+    if maxdf is None:
+        maxdf = len(documents)
+    elif isinstance(maxdf, float):
+        maxdf = maxdf * len(documents)
+
+    kept = [word for word in counts if counts[word] >= mincount and
+            mindf <= dfs[word] <= maxdf]
+    maxvocab = config.get('maxvocab')
+    if maxvocab is not None and len(kept) > maxvocab:
+        #nlargest keeps the first appearance order between equal counts
+        kept = heapq.nlargest(maxvocab, kept, key=counts.get)
+    kept = set(kept)
+
+    config['pruned_vocabulary'] = (len(counts), len(kept))
+    print('Vocabulary pruned from {0} to {1} words.'.format(len(counts),
+        len(kept)))
+    if len(kept) == 0:
+        raise ValueError('No word is left after pruning the vocabulary!')
+
+    pruned = []
+    for docname, entries in documents:
+        entries = [(word, freq) for word, freq in entries if word in kept]
+        if len(entries) == 0:
+            print('Document "{0}" has no words left after pruning and is ignored!'.format(
+                docname))
+            continue
+        pruned.append((docname, entries))
+    return pruned
+
+def iter_document_word_ids(fnames, config, word_id_dict, grow=True):
+    """
+    yield (docname, word_ids, freqs) for every document that contributes
+    words, in the order of fnames. Word ids are added to word_id_dict in order
+    of first appearance, only for words that reach minoccurrence in some
+    document, so they are compact without any re-indexing. If grow is False,
+    word_id_dict is left as it is and words that are not in it are ignored.
+    A global pruning needs the counts of every document, so in that case all
+    the documents are counted before the first one is yielded.
+    """
+    stopwords = lexicon.as_lexicon(config['stopwords'])
+
+    documents = iter_document_words(fnames, config, stopwords)
+    if grow and pruning_requested(config):
+        documents = prune_vocabulary(list(documents), config)
+
+    for docname, entries in documents:
+        word_ids = []
+        freqs = []
+        for word, freq in entries:
+            word_id = word_id_dict.get(word)
+            if word_id is None:
+                if not grow:
+                    continue
+                word_id = word_id_dict[word] = len(word_id_dict)
+            word_ids.append(word_id)
+            freqs.append(freq)
+
+        yield docname, word_ids, freqs
+
+def iter_dat_lines(fnames, config, word_id_dict):
+    """
+    yield (docname, dat_line) for every document that contributes words,
+    converting each document in a single pass. Word ids are added to
+    word_id_dict as in iter_document_word_ids.
+    """
+    for docname, word_ids, freqs in iter_document_word_ids(fnames, config,
+            word_id_dict):
+        entries = ['%d:%d' % entry for entry in zip(word_ids, freqs)]
+        yield docname, str(len(entries)) + ' ' + ' '.join(entries) + '\n'
 
-        for word in freq_dict.keys():
-            dat_line += str(word_id_dict[word]) + ':' + str(freq_dict[word]) + ' '
+def generate_dat_lines_and_word_ids(fnames, config):
+    """
+    convert the documents to a list of .dat lines and write the .dmap file.
+    generate_dat_and_vocab_files writes the lines in blocks instead of
+    keeping them all.
+    """
+    word_id_dict = dict()
+    used_docs = [] #needed to generate .dmap file
+    dat_lines = [] #.dat file output
 
-        #last blank in dat_line is removed
-        dat_lines.append(str(len(freq_dict)) + ' ' + dat_line[:-1] + '\n')
+    for docname, dat_line in iter_dat_lines(fnames, config, word_id_dict):
+        used_docs.append(docname)
+        dat_lines.append(dat_line)
 
     write_document_map_file(used_docs, config['dmapname'])
 
     return dat_lines, word_id_dict
 
+def generate_document_term_matrix(fnames, config, vocabulary=None):
+    """
+    build the document-term matrix in memory, without writing or parsing the
+    .dat, .vocab and .dmap files. Returns a scipy.sparse CSR matrix, the
+    vocabulary as a tuple ordered by word id and the names of the documents
+    of each row. If a vocabulary is given, its word ids are used and the
+    words that are not in it are ignored.
+    """
+    import numpy as np
+    import scipy.sparse
 
-def generate_dat_and_vocab_files(fnames, config):
+    word_id_dict = dict()
+    if vocabulary is not None:
+        word_id_dict = dict((word, word_id) for word_id, word in enumerate(vocabulary))
+    used_docs = []
+    indptr = [0]
+    indices = []
+    data = []
+
+    for docname, word_ids, freqs in iter_document_word_ids(fnames, config,
+            word_id_dict, grow=vocabulary is None):
+        used_docs.append(docname)
+        indices.extend(word_ids)
+        data.extend(freqs)
+        indptr.append(len(indices))
+
+    matrix = scipy.sparse.csr_matrix(
+            (np.array(data, dtype=np.intc), np.array(indices, dtype=np.intc),
+                np.array(indptr, dtype=np.intc)),
+            shape=(len(used_docs), len(word_id_dict)))
 
-    with codecs.open(config['datname'], 'w', 'utf-8') as datfile:
-        dat_lines, word_id_dict = generate_dat_lines_and_word_ids(fnames,
-                config)
-        datfile.writelines(dat_lines)
+    print('Found {0} unique words in {1} files.'.format(
+        len(word_id_dict), len(fnames)))
 
-    #sort word_id_dict ascending by value und write the words in that
-    #order to a .vocab file
+    return matrix, tuple(word_id_dict), used_docs
+
+
+def generate_dat_and_vocab_files(fnames, config, block_size=1000):
+    """
+    write the .dat and .dmap files in blocks of block_size documents, so
+    only one block of lines is kept in memory, and then the .vocab file.
+    """
+    word_id_dict = dict()
+    dat_lines = iter_dat_lines(fnames, config, word_id_dict)
+
+    with codecs.open(config['datname'], 'w', 'utf-8') as datfile, \
+            codecs.open(config['dmapname'], 'w', 'utf-8') as d_file:
+        while True:
+            block = list(itertools.islice(dat_lines, block_size))
+            if len(block) == 0:
+                break
+            datfile.writelines(dat_line for docname, dat_line in block)
+            d_file.writelines(docname + '\n' for docname, dat_line in block)
+
+    #word ids follow the insertion order of word_id_dict, so the words are
+    #written to the .vocab file in that order
     with codecs.open(config['vocabname'], 'w', 'utf-8') as vocabfile:
-        for item in sorted(word_id_dict.items(), key=operator.itemgetter(1)):
-            vocabfile.write(item[0]+'\n')
+        vocabfile.write(''.join(word + '\n' for word in word_id_dict))
 
     print('Found {0} unique words in {1} files.'.format(
         len(word_id_dict), len(fnames)))
@@ -207,15 +389,20 @@ if __name__=='__main__':
     config['dmapname'] = outdir_name + basename + '.dmap'
     config['minlength'] = parser.minlength
     config['minoccurrence'] = parser.minoccurrence
+    config['jobs'] = parser.jobs
+    config['mincount'] = parser.mincount
+    config['mindf'] = parser.mindf
+    config['maxdf'] = parser.maxdf
+    config['maxvocab'] = parser.maxvocab
     if parser.stopword_file:
         config['stopwords'] = load_stopwords(parser.stopword_file)
     else:
-        config['stopwords'] = set()
+        config['stopwords'] = lexicon.Lexicon()
 
     fnames = get_filenames(dirname, parser.extension)
     
     try:
         generate_dat_and_vocab_files(fnames, config)
-    except IOError as ioe:
-        print(ioe)
+    except (IOError, ValueError) as error:
+        print(error)
         sys.exit(1)